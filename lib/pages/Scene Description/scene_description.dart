@@ -3,8 +3,6 @@ import 'package:flutter/material.dart';
 import 'package:http/http.dart' as http;
 import 'package:flutter_tts/flutter_tts.dart';
 import 'dart:convert';
-import 'dart:io';
-import 'package:path_provider/path_provider.dart';
 import 'package:req_demo/pages/Flutter_STT/language_translation.dart';
 import 'package:req_demo/pages/Flutter_TTS/tts.dart';
 import 'package:req_demo/pages/Settings/app_settings.dart';
@@ -20,7 +18,7 @@ class SceneDescriptionScreen extends StatefulWidget {
 }
 
 class _SceneDescriptionScreenState extends State<SceneDescriptionScreen> {
-  File? _capturedImage;
+  Uint8List? _capturedImage;
   String? _description;
   bool _isProcessing = false;
   final FlutterTts flutterTts = FlutterTts();
@@ -51,18 +49,12 @@ class _SceneDescriptionScreenState extends State<SceneDescriptionScreen> {
 
       if (response.statusCode != 200) throw Exception("Failed to load image");
 
-      // 📂 Save image locally
       final bytes = response.bodyBytes;
-      final tempDir = await getTemporaryDirectory();
-      final filePath =
-          "${tempDir.path}/scene_${DateTime.now().millisecondsSinceEpoch}.jpg";
-      final imageFile = File(filePath);
-      await imageFile.writeAsBytes(bytes);
 
-      setState(() => _capturedImage = imageFile);
+      setState(() => _capturedImage = bytes);
 
       // 🧠 Send image to captioning server
-      await _sendToServer(imageFile);
+      await _sendToServer(bytes);
     } catch (e) {
       print("❌ Error fetching image: $e");
       await flutterTts.speak("Error fetching image from camera");
@@ -70,17 +62,17 @@ class _SceneDescriptionScreenState extends State<SceneDescriptionScreen> {
     }
   }
 
-  Future<void> _sendToServer(File imageFile) async {
+  Future<void> _sendToServer(Uint8List imageBytes) async {
     try {
-      final request = http.MultipartRequest("POST", Uri.parse(serverUrl));
-      request.files
-          .add(await http.MultipartFile.fromPath("file", imageFile.path));
-
-      final response = await request.send();
+      // Raw JPEG body: no temp file and no multipart encoding
+      final response = await http.post(
+        Uri.parse(serverUrl),
+        headers: {"Content-Type": "image/jpeg"},
+        body: imageBytes,
+      );
 
       if (response.statusCode == 200) {
-        final respStr = await response.stream.bytesToString();
-        final data = jsonDecode(respStr);
+        final data = jsonDecode(response.body);
         String? translated_text =
             "This looks like" + data["caption"] ?? "No description found";
 
@@ -131,7 +123,7 @@ class _SceneDescriptionScreenState extends State<SceneDescriptionScreen> {
                   ? "Processing, please wait..."
                   : "ಪ್ರಕ್ರಿಯೆಗೊಳಿಸಲಾಗುತ್ತಿದೆ, ದಯವಿಟ್ಟು ನಿರೀಕ್ಷಿಸಿ..."),
             ] else if (_capturedImage != null) ...[
-              Image.file(_capturedImage!, height: 250),
+              Image.memory(_capturedImage!, height: 250),
               const SizedBox(height: 20),
               if (_description != null)
                 Text(
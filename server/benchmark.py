@@ -0,0 +1,324 @@
+"""
+End-to-end load and latency benchmark for the API server
+
+Starts the real app with uvicorn in a subprocess, pointed at a local Groq
+stand-in (fake_groq.py), then drives /caption and/or /get_user_intent at one
+or more concurrency levels. For each run it records p50/p95/p99 latency,
+throughput, status codes, peak RSS and current PSS of the server process
+tree (PSS counts pages shared between workers only once) and event-loop
+lag as sampled by the server itself.
+
+Usage:
+    python benchmark.py --scenario mixed --concurrency 1,4,16 --requests 200 --json results.json
+    python benchmark.py --scenario caption --env CAPTION_MAX_BATCH_SIZE=8 --env CAPTION_PRECISION=int8
+    python benchmark.py --scenario caption --workers 4 --env CAPTION_SHARED_WEIGHTS_DIR=/var/cache/classecho
+
+Without --images a fixed synthetic image set is used, so results are
+comparable across runs and machines.
+
+The intent requests cycle through a dozen transcripts, which after the first
+round would all be answered by the local fast path or the intent cache. So
+both are switched off (INTENT_FASTPATH=0, INTENT_CACHE_SIZE=0) and every
+intent request measures the Groq path; pass --intent-shortcuts to keep them.
+"""
+import argparse
+import asyncio
+import io
+import itertools
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+import httpx
+
+from fake_groq import FakeGroqServer, free_port
+
+SERVER_DIR = os.path.dirname(os.path.abspath(__file__))
+
+TRANSCRIPTS = [
+    "What's around me",
+    "Describe my surroundings",
+    "Read the sign in front of me",
+    "Call option number 2",
+    "Call Pradeep",
+    "Share my location",
+    "Send my location to mom",
+    "Yes",
+    "No",
+    "Navigate to home",
+    "I need help",
+    "Show me my contacts",
+]
+
+# Server environment that sends every intent request to Groq
+LLM_PATH_ENV = {"INTENT_FASTPATH": "0", "INTENT_CACHE_SIZE": "0"}
+
+
+def jpeg_images(directory):
+    from compare_precision import load_images
+
+    encoded = []
+    for image in load_images(directory):
+        buffer = io.BytesIO()
+        image.save(buffer, "JPEG", quality=85)
+        encoded.append(buffer.getvalue())
+    return encoded
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def process_tree(pid):
+    pids = [pid]
+    for current in pids:
+        try:
+            for tid in os.listdir(f"/proc/{current}/task"):
+                with open(f"/proc/{current}/task/{tid}/children") as f:
+                    pids.extend(int(child) for child in f.read().split())
+        except OSError:
+            continue
+    return pids
+
+
+def peak_rss_mb(pid):
+    """Sum of peak resident memory (VmHWM) across the server's process tree"""
+    total_kb = 0
+    for child in process_tree(pid):
+        try:
+            with open(f"/proc/{child}/status") as f:
+                for line in f:
+                    if line.startswith("VmHWM:"):
+                        total_kb += int(line.split()[1])
+        except OSError:
+            continue
+    return total_kb / 1024
+
+
+def pss_mb(pid):
+    """Sum of proportional set size across the process tree; shared pages count once in total"""
+    total_kb = 0
+    for child in process_tree(pid):
+        try:
+            with open(f"/proc/{child}/smaps_rollup") as f:
+                for line in f:
+                    if line.startswith("Pss:"):
+                        total_kb += int(line.split()[1])
+        except OSError:
+            continue
+    return total_kb / 1024
+
+
+class ServerProcess:
+    """The API server under test, run with uvicorn in a subprocess"""
+
+    def __init__(self, groq_url, role, workers, extra_env, startup_timeout):
+        self.port = free_port()
+        self.startup_timeout = startup_timeout
+        env = dict(os.environ)
+        env.update({
+            "GROQ_BASE_URL": groq_url,
+            "GROQ_API_KEY": env.get("BENCH_GROQ_API_KEY", "bench-key"),
+            "SERVER_ROLE": role,
+        })
+        env.update(extra_env)
+        self.command = [
+            sys.executable, "-m", "uvicorn", "server:app",
+            "--host", "127.0.0.1", "--port", str(self.port),
+            "--workers", str(workers), "--log-level", "warning",
+        ]
+        self.env = env
+        self.process = None
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.port}"
+
+    def __enter__(self):
+        self.process = subprocess.Popen(self.command, cwd=SERVER_DIR, env=self.env)
+        deadline = time.monotonic() + self.startup_timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"Server exited during startup with code {self.process.returncode}")
+            try:
+                if httpx.get(f"{self.base_url}/ready", timeout=1).status_code == 200:
+                    return self
+            except httpx.HTTPError:
+                pass
+            time.sleep(0.5)
+        self.__exit__()
+        raise RuntimeError(f"Server not ready after {self.startup_timeout}s")
+
+    def __exit__(self, *exc):
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+
+
+async def sample_loop_lag(client, samples, stop):
+    while not stop.is_set():
+        try:
+            status = (await client.get("/api-status", timeout=5)).json()
+            samples.append(status["event_loop_lag"]["recent_max_ms"])
+        except (httpx.HTTPError, KeyError, ValueError):
+            pass
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=1)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def drive(base_url, scenario, concurrency, total_requests, duration, images):
+    """Run one load level and return per-endpoint latency records"""
+    if scenario == "caption":
+        kinds = itertools.repeat("caption")
+    elif scenario == "intent":
+        kinds = itertools.repeat("intent")
+    else:
+        kinds = itertools.cycle(["caption", "intent", "intent"])
+    counter = itertools.count()
+    image_cycle = itertools.cycle(images)
+    transcript_cycle = itertools.cycle(TRANSCRIPTS)
+    records = []
+
+    limits = httpx.Limits(max_connections=concurrency + 2)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=120) as client:
+        stop = asyncio.Event()
+        lag_samples = []
+        lag_task = asyncio.create_task(sample_loop_lag(client, lag_samples, stop))
+        started = time.perf_counter()
+        deadline = started + duration if duration else None
+
+        async def worker():
+            while True:
+                if deadline is not None:
+                    if time.perf_counter() >= deadline:
+                        return
+                elif next(counter) >= total_requests:
+                    return
+
+                kind = next(kinds)
+                request_started = time.perf_counter()
+                try:
+                    if kind == "caption":
+                        files = {"file": ("frame.jpg", next(image_cycle), "image/jpeg")}
+                        response = await client.post("/caption", files=files)
+                    else:
+                        response = await client.post("/get_user_intent", json={"audioText": next(transcript_cycle)})
+                    status = response.status_code
+                except httpx.HTTPError as e:
+                    status = type(e).__name__
+                records.append((kind, time.perf_counter() - request_started, status))
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+        stop.set()
+        await lag_task
+        status = (await client.get("/api-status")).json()
+
+    return records, elapsed, lag_samples, status
+
+
+def summarize(records, elapsed):
+    summary = {}
+    for kind in sorted({record[0] for record in records}):
+        latencies = sorted(latency * 1000 for k, latency, _ in records if k == kind)
+        statuses = {}
+        for k, _, status in records:
+            if k == kind:
+                statuses[str(status)] = statuses.get(str(status), 0) + 1
+        ok = statuses.get("200", 0)
+        summary[kind] = {
+            "requests": len(latencies),
+            "ok": ok,
+            "statuses": statuses,
+            "throughput_rps": ok / elapsed if elapsed else 0.0,
+            "latency_ms": {
+                "p50": percentile(latencies, 0.50),
+                "p95": percentile(latencies, 0.95),
+                "p99": percentile(latencies, 0.99),
+                "max": latencies[-1] if latencies else None,
+            },
+        }
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenario", choices=("caption", "intent", "mixed"), default="mixed")
+    parser.add_argument("--concurrency", default="1,4,16", help="Comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=100, help="Requests per concurrency level")
+    parser.add_argument("--duration", type=float, help="Seconds per level (overrides --requests)")
+    parser.add_argument("--groq-latency-ms", type=float, default=300.0, help="Latency of the Groq stand-in")
+    parser.add_argument("--role", default="both", help="SERVER_ROLE for the server under test")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    parser.add_argument("--images", help="Directory of .jpg/.png images (default: synthetic set)")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE",
+                        help="Extra environment for the server, e.g. CAPTION_MAX_BATCH_SIZE=8")
+    parser.add_argument("--intent-shortcuts", action="store_true",
+                        help="Keep the local intent fast path and intent cache enabled")
+    parser.add_argument("--startup-timeout", type=float, default=600.0)
+    parser.add_argument("--json", help="Write machine-readable results to this file")
+    args = parser.parse_args()
+
+    extra_env = {} if args.intent_shortcuts else dict(LLM_PATH_ENV)
+    extra_env.update(item.split("=", 1) for item in args.env)
+    levels = [int(level) for level in args.concurrency.split(",") if level.strip()]
+    images = jpeg_images(args.images)
+
+    report = {
+        "scenario": args.scenario,
+        "config": {
+            "groq_latency_ms": args.groq_latency_ms,
+            "role": args.role,
+            "workers": args.workers,
+            "env": extra_env,
+            "images": len(images),
+        },
+        "machine": {"platform": platform.platform(), "python": platform.python_version(), "cpus": os.cpu_count()},
+        "runs": [],
+    }
+
+    with FakeGroqServer(latency_ms=args.groq_latency_ms) as fake_groq:
+        with ServerProcess(fake_groq.base_url, args.role, args.workers, extra_env, args.startup_timeout) as server:
+            for concurrency in levels:
+                records, elapsed, lag_samples, status = asyncio.run(
+                    drive(server.base_url, args.scenario, concurrency, args.requests, args.duration, images)
+                )
+                run = {
+                    "concurrency": concurrency,
+                    "elapsed_s": elapsed,
+                    "endpoints": summarize(records, elapsed),
+                    "peak_rss_mb": peak_rss_mb(server.process.pid),
+                    "pss_mb": pss_mb(server.process.pid),
+                    "event_loop_lag_ms": {
+                        "max": max(lag_samples) if lag_samples else None,
+                        "mean_of_window_max": (sum(lag_samples) / len(lag_samples)) if lag_samples else None,
+                    },
+                    "server_status": status,
+                }
+                report["runs"].append(run)
+
+                for kind, endpoint in run["endpoints"].items():
+                    latency = endpoint["latency_ms"]
+                    print(f"c={concurrency:<3} {kind:<8} ok={endpoint['ok']:<5} "
+                          f"rps={endpoint['throughput_rps']:7.2f} p50={latency['p50']:8.1f} "
+                          f"p95={latency['p95']:8.1f} p99={latency['p99']:8.1f} ms")
+                print(f"c={concurrency:<3} peak_rss={run['peak_rss_mb']:.0f} MB pss={run['pss_mb']:.0f} MB "
+                      f"loop_lag_max={run['event_loop_lag_ms']['max']} ms")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,312 @@
+import fcntl
+import logging
+import os
+
+import numpy as np
+import torch
+from transformers import (
+    BlipConfig,
+    BlipProcessor,
+    BlipForConditionalGeneration,
+    StoppingCriteria,
+    StoppingCriteriaList,
+    TextStreamer,
+)
+
+logger = logging.getLogger(__name__)
+
+CAPTION_MODEL_ID = "Salesforce/blip-image-captioning-large"
+PRECISION_MODES = ("fp32", "int8", "bf16")
+
+
+def resolve_device():
+    return "cuda" if torch.cuda.is_available() else "cpu"
+
+
+def cpu_supports_bf16() -> bool:
+    """True when the CPU has native bf16 instructions (AVX512-BF16 or AMX)"""
+    try:
+        return bool(torch.ops.mkldnn._is_mkldnn_bf16_supported())
+    except (AttributeError, RuntimeError):
+        return False
+
+
+def resolve_precision(precision, device):
+    """
+    Validate a requested precision mode for the given device
+
+    Falls back to fp32 (with a warning) when the mode cannot run here:
+    dynamic int8 quantization is CPU-only, and bf16 on CPU needs native
+    bf16 support to be faster than fp32.
+    """
+    precision = (precision or "fp32").lower()
+    if precision not in PRECISION_MODES:
+        raise ValueError(f"Unknown caption precision '{precision}', expected one of {PRECISION_MODES}")
+
+    if precision == "int8" and device != "cpu":
+        logger.warning("int8 dynamic quantization is CPU-only, using fp32")
+        return "fp32"
+    if precision == "bf16" and device == "cpu" and not cpu_supports_bf16():
+        logger.warning("CPU has no native bf16 support, using fp32")
+        return "fp32"
+    return precision
+
+
+def shared_weights_dir(directory, precision, model_id=CAPTION_MODEL_ID):
+    return os.path.join(directory, f"{model_id.replace('/', '--')}-{precision}")
+
+
+def export_shared_weights(directory, precision, model_id=CAPTION_MODEL_ID):
+    """
+    Write the model's tensors and config for load_shared_model, once
+
+    Every worker calls this at startup; a file lock makes the first one do
+    the export while the others wait for it.
+
+    Returns:
+        str: Directory holding weights.pt and config.json
+    """
+    target = shared_weights_dir(directory, precision, model_id)
+    os.makedirs(target, exist_ok=True)
+    weights_path = os.path.join(target, "weights.pt")
+
+    with open(os.path.join(target, ".lock"), "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        if not os.path.exists(weights_path):
+            model = BlipForConditionalGeneration.from_pretrained(model_id)
+            if precision == "bf16":
+                model = model.to(dtype=torch.bfloat16)
+            # Buffers are saved too, including non-persistent ones that a
+            # state_dict would leave out
+            tensors = {name: tensor.detach() for name, tensor in model.named_parameters()}
+            tensors.update(model.named_buffers())
+            torch.save(tensors, weights_path + ".tmp")
+            model.config.save_pretrained(target)
+            os.replace(weights_path + ".tmp", weights_path)
+            logger.info(f"Exported shared caption weights to {weights_path}")
+    return target
+
+
+def load_shared_model(directory):
+    """
+    Build the model around memory-mapped weights from export_shared_weights
+
+    The tensors are backed by read-only pages of the weights file, so every
+    worker process mapping the same file shares one copy in the page cache;
+    each worker only adds its own activations.
+    """
+    config = BlipConfig.from_pretrained(directory)
+    with torch.device("meta"):
+        model = BlipForConditionalGeneration(config)
+
+    tensors = torch.load(os.path.join(directory, "weights.pt"), mmap=True, weights_only=True)
+    for name, tensor in tensors.items():
+        module_name, _, attr = name.rpartition(".")
+        module = model.get_submodule(module_name)
+        if attr in module._parameters:
+            module._parameters[attr] = torch.nn.Parameter(tensor, requires_grad=False)
+        else:
+            module._buffers[attr] = tensor
+    model.tie_weights()
+
+    missing = [name for name, tensor in [*model.named_parameters(), *model.named_buffers()] if tensor.is_meta]
+    if missing:
+        raise RuntimeError(f"Shared caption weights are missing {len(missing)} tensors, e.g. {missing[0]}")
+    return model
+
+
+def load_caption_model(precision="fp32", device=None, shared_dir=None, model_id=CAPTION_MODEL_ID):
+    """
+    Load the BLIP processor and captioning model in the requested precision
+
+    With shared_dir, fp32 and bf16 weights are memory-mapped from a file
+    exported there (see load_shared_model) instead of loaded privately, so
+    several worker processes share one copy. int8 packs its weights into
+    quantized modules that cannot be mapped, so it always loads privately.
+
+    Returns:
+        tuple: (processor, model, device, precision) where precision is the
+               mode actually applied after resolve_precision
+    """
+    device = device or resolve_device()
+    precision = resolve_precision(precision, device)
+
+    processor = BlipProcessor.from_pretrained(model_id)
+    if shared_dir and device == "cpu" and precision != "int8":
+        model = load_shared_model(export_shared_weights(shared_dir, precision, model_id))
+        logger.info(f"Loaded {model_id} on {device} in {precision} from shared weights")
+        return processor, model.eval(), device, precision
+    if shared_dir:
+        logger.warning(f"Shared weights need fp32 or bf16 on CPU, loading a private {precision} copy on {device}")
+
+    model = BlipForConditionalGeneration.from_pretrained(model_id)
+
+    if precision == "int8":
+        # Weights of every Linear layer are stored as int8; activations are
+        # quantized on the fly, so no calibration data is needed
+        model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    elif precision == "bf16":
+        model = model.to(dtype=torch.bfloat16)
+
+    model = model.to(device).eval()
+    logger.info(f"Loaded {model_id} on {device} in {precision}")
+    return processor, model, device, precision
+
+
+def model_dtype(model):
+    """Floating point dtype the model expects for pixel_values"""
+    for param in model.parameters():
+        if param.is_floating_point():
+            return param.dtype
+    return torch.float32
+
+
+class AsyncCaptionStreamer(TextStreamer):
+    """
+    Forwards decoded caption text from the inference thread to an asyncio queue
+
+    Each queue item is (text, stream_end). Only a single image can be streamed
+    per generate call.
+    """
+
+    def __init__(self, tokenizer, loop, queue):
+        super().__init__(tokenizer, skip_special_tokens=True)
+        self.loop = loop
+        self.queue = queue
+
+    def on_finalized_text(self, text, stream_end=False):
+        self.loop.call_soon_threadsafe(self.queue.put_nowait, (text, stream_end))
+
+
+class CancelCriteria(StoppingCriteria):
+    """Stops generation once the given threading.Event is set"""
+
+    def __init__(self, cancel_event):
+        self.cancel_event = cancel_event
+
+    def __call__(self, input_ids, scores, **kwargs):
+        return torch.full((input_ids.shape[0],), self.cancel_event.is_set(), dtype=torch.bool,
+                          device=input_ids.device)
+
+
+def input_size(processor):
+    """(width, height) of the images the model expects"""
+    size = processor.image_processor.size
+    return size["width"], size["height"]
+
+
+def pixel_values_from_image(image, processor):
+    """
+    Normalized (3, H, W) float tensor from an RGB PIL image already at input_size
+
+    Equivalent to the processor's rescale + normalize, but converts the PIL
+    buffer to float32 in a single copy and normalizes it in place.
+    """
+    image_processor = processor.image_processor
+    mean = np.asarray(image_processor.image_mean, dtype=np.float32)
+    std = np.asarray(image_processor.image_std, dtype=np.float32)
+
+    pixels = np.asarray(image, dtype=np.float32)  # (H, W, 3), owns its memory
+    pixels *= 1.0 / (255.0 * std)
+    pixels -= mean / std
+    return torch.from_numpy(pixels).permute(2, 0, 1)
+
+
+def generate_captions(processor, model, device, images, max_length=30, streamer=None, cancel_event=None):
+    """Run one batched BLIP pass over PIL images and return one caption per image"""
+    inputs = processor(images=images, return_tensors="pt")
+    return generate_from_pixels(processor, model, device, inputs["pixel_values"], max_length=max_length,
+                                streamer=streamer, cancel_event=cancel_event)
+
+
+def generate_from_pixels(processor, model, device, pixel_values, max_length=30, streamer=None, cancel_event=None):
+    """
+    Run one batched BLIP pass over preprocessed pixel values
+
+    Args:
+        pixel_values: (N, 3, H, W) tensor, or a list of (3, H, W) tensors
+                      from pixel_values_from_image
+    """
+    out = generate_ids(model, device, pixel_values, max_length=max_length, streamer=streamer,
+                       cancel_event=cancel_event)
+    return processor.batch_decode(out, skip_special_tokens=True)
+
+
+def generate_ids(model, device, pixel_values, max_length=30, streamer=None, cancel_event=None):
+    """Like generate_from_pixels, but returns the generated token ids undecoded"""
+    if isinstance(pixel_values, (list, tuple)):
+        pixel_values = torch.stack(pixel_values)
+    pixel_values = pixel_values.to(device, model_dtype(model))
+
+    generate_kwargs = {"max_length": max_length}
+    if streamer is not None:
+        generate_kwargs["streamer"] = streamer
+    if cancel_event is not None:
+        generate_kwargs["stopping_criteria"] = StoppingCriteriaList([CancelCriteria(cancel_event)])
+
+    with torch.inference_mode():
+        return model.generate(pixel_values=pixel_values, **generate_kwargs)
+
+
+def encode_images(model, device, pixel_values):
+    """Run only the vision encoder; returns image embeddings of shape (N, patches, hidden)"""
+    if isinstance(pixel_values, (list, tuple)):
+        pixel_values = torch.stack(pixel_values)
+    pixel_values = pixel_values.to(device, model_dtype(model))
+    with torch.inference_mode():
+        return model.vision_model(pixel_values=pixel_values)[0]
+
+
+def generate_from_embeds(processor, model, image_embeds, prompt="", max_length=30):
+    """
+    Run only the text decoder against cached image embeddings of one image
+
+    Mirrors BlipForConditionalGeneration.generate: an empty prompt gives an
+    unconditional caption, otherwise the caption continues the prompt text.
+    """
+    text_config = model.config.text_config
+    text = processor.tokenizer(prompt, return_tensors="pt")
+    input_ids = text["input_ids"].to(image_embeds.device)
+    attention_mask = text["attention_mask"].to(image_embeds.device)
+    input_ids[:, 0] = text_config.bos_token_id
+
+    image_attention_mask = torch.ones(image_embeds.size()[:-1], dtype=torch.long, device=image_embeds.device)
+    with torch.inference_mode():
+        out = model.text_decoder.generate(
+            input_ids=input_ids[:, :-1],
+            attention_mask=attention_mask[:, :-1],
+            eos_token_id=text_config.sep_token_id,
+            pad_token_id=text_config.pad_token_id,
+            encoder_hidden_states=image_embeds,
+            encoder_attention_mask=image_attention_mask,
+            max_length=max_length,
+        )
+    return processor.decode(out[0], skip_special_tokens=True)
+
+
+def process_memory_mb():
+    """
+    Resident memory of this process in MB, split into rss, pss (shared pages
+    divided among the processes mapping them) and private (Linux)
+    """
+    fields = {"Rss:": "rss_mb", "Pss:": "pss_mb", "Private_Clean:": "private_mb", "Private_Dirty:": "private_mb"}
+    memory = {"rss_mb": 0.0, "pss_mb": 0.0, "private_mb": 0.0}
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            for line in f:
+                parts = line.split()
+                if parts and parts[0] in fields:
+                    memory[fields[parts[0]]] += int(parts[1]) / 1024
+    except OSError:
+        pass
+    return memory
+
+
+def current_rss_mb() -> float:
+    """Resident set size of this process in MB (Linux)"""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError):
+        return 0.0
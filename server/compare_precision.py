@@ -0,0 +1,151 @@
+"""
+Compare caption model precision modes against fp32
+
+Each mode is loaded in its own subprocess so resident memory is measured
+independently. For every mode the report shows load time, per-caption
+latency, resident memory and how closely its captions agree with fp32.
+
+Usage:
+    python compare_precision.py [--images DIR] [--modes fp32,int8,bf16] [--runs 3] [--json out.json]
+
+Without --images a fixed, deterministic set of synthetic images is used.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from PIL import Image, ImageDraw
+
+from caption_model import PRECISION_MODES
+
+
+def synthetic_images(count=8, size=(640, 480)):
+    """Deterministic set of simple scenes so runs are comparable across machines"""
+    images = []
+    for i in range(count):
+        image = Image.new("RGB", size, ((37 * i) % 256, (91 * i) % 256, (53 * i) % 256))
+        draw = ImageDraw.Draw(image)
+        for j in range(4):
+            x0 = (i * 47 + j * 113) % (size[0] - 160)
+            y0 = (i * 29 + j * 71) % (size[1] - 120)
+            color = ((i * 60 + j * 90) % 256, (j * 70) % 256, (i * 30) % 256)
+            if (i + j) % 2:
+                draw.ellipse([x0, y0, x0 + 150, y0 + 110], fill=color)
+            else:
+                draw.rectangle([x0, y0, x0 + 150, y0 + 110], fill=color)
+        images.append(image)
+    return images
+
+
+def load_images(directory):
+    if not directory:
+        return synthetic_images()
+
+    names = sorted(
+        name for name in os.listdir(directory)
+        if name.lower().endswith((".jpg", ".jpeg", ".png"))
+    )
+    return [Image.open(os.path.join(directory, name)).convert("RGB") for name in names]
+
+
+def run_worker(precision, images_dir, runs):
+    """Load one precision mode, caption the image set and print a JSON result"""
+    from caption_model import load_caption_model, generate_captions, current_rss_mb
+
+    images = load_images(images_dir)
+    rss_before = current_rss_mb()
+
+    started = time.perf_counter()
+    processor, model, device, applied = load_caption_model(precision)
+    load_seconds = time.perf_counter() - started
+
+    # Warm up once so lazy kernel initialisation is not counted
+    generate_captions(processor, model, device, images[:1])
+
+    latencies = []
+    captions = []
+    for _ in range(runs):
+        captions = []
+        for image in images:
+            started = time.perf_counter()
+            captions.extend(generate_captions(processor, model, device, [image]))
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    print(json.dumps({
+        "precision": applied,
+        "requested": precision,
+        "device": device,
+        "load_seconds": load_seconds,
+        "rss_mb": current_rss_mb(),
+        "model_rss_mb": current_rss_mb() - rss_before,
+        "latency_ms_p50": statistics.median(latencies),
+        "latency_ms_mean": statistics.fmean(latencies),
+        "latency_ms_max": max(latencies),
+        "captions": captions,
+    }))
+
+
+def word_f1(reference, candidate):
+    ref, cand = reference.lower().split(), candidate.lower().split()
+    if not ref or not cand:
+        return float(ref == cand)
+    common = sum(min(ref.count(word), cand.count(word)) for word in set(cand))
+    if common == 0:
+        return 0.0
+    precision, recall = common / len(cand), common / len(ref)
+    return 2 * precision * recall / (precision + recall)
+
+
+def agreement(reference, candidate):
+    pairs = list(zip(reference, candidate))
+    return {
+        "exact_match": sum(ref == cand for ref, cand in pairs) / len(pairs),
+        "word_f1": statistics.fmean(word_f1(ref, cand) for ref, cand in pairs),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", help="Directory of .jpg/.png images (default: synthetic set)")
+    parser.add_argument("--modes", default=",".join(PRECISION_MODES))
+    parser.add_argument("--runs", type=int, default=3, help="Passes over the image set per mode")
+    parser.add_argument("--json", help="Write the full report to this file")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args.worker, args.images, args.runs)
+        return
+
+    modes = [mode.strip() for mode in args.modes.split(",") if mode.strip()]
+    if "fp32" not in modes:
+        modes.insert(0, "fp32")
+
+    results = {}
+    for mode in modes:
+        command = [sys.executable, os.path.abspath(__file__), "--worker", mode, "--runs", str(args.runs)]
+        if args.images:
+            command += ["--images", args.images]
+        output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+        results[mode] = json.loads(output.strip().splitlines()[-1])
+
+    baseline = results["fp32"]
+    print(f"{'mode':<6} {'applied':<8} {'load s':>7} {'p50 ms':>8} {'mean ms':>8} {'rss MB':>8} "
+          f"{'exact':>6} {'wordF1':>7}")
+    for mode, result in results.items():
+        result["agreement_vs_fp32"] = agreement(baseline["captions"], result["captions"])
+        print(f"{mode:<6} {result['precision']:<8} {result['load_seconds']:>7.1f} "
+              f"{result['latency_ms_p50']:>8.1f} {result['latency_ms_mean']:>8.1f} {result['rss_mb']:>8.0f} "
+              f"{result['agreement_vs_fp32']['exact_match']:>6.2f} {result['agreement_vs_fp32']['word_f1']:>7.2f}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
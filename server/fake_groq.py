@@ -0,0 +1,250 @@
+"""
+Local stand-in for the Groq chat-completions API
+
+Serves POST /openai/v1/chat/completions in the OpenAI response format so the
+real Groq SDK can talk to it: point the server at it with
+GROQ_BASE_URL=http://127.0.0.1:<port>. Used by the benchmark suite so load
+tests never touch the real API or its rate limits.
+
+Usage:
+    python fake_groq.py [--port 8100] [--latency-ms 300] [--latency-jitter-ms 200]
+                        [--requests-per-minute 30] [--rate-limit-probability 0.05]
+                        [--script responses.json] [--seed 1]
+"""
+import argparse
+import asyncio
+import json
+import random
+import re
+import socket
+import threading
+import time
+import uuid
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+EMPTY_INTENT = {
+    "intent": "unknown",
+    "listen_back": False,
+    "contact_option": None,
+    "contact_name": None,
+    "want_to_call": False,
+    "want_to_share": False,
+    "response": None,
+}
+
+
+def extract_transcript(messages):
+    """Pull the user's transcript out of the intent prompt"""
+    for message in reversed(messages):
+        match = re.search(r'Text: "(.*)"', message.get("content") or "")
+        if match:
+            return match.group(1)
+    return messages[-1].get("content", "") if messages else ""
+
+
+def keyword_intent(transcript):
+    """Cheap, deterministic intent guess so responses look realistic"""
+    text = transcript.lower()
+    intent = dict(EMPTY_INTENT)
+    if any(word in text for word in ("help", "emergency", "alert")):
+        intent.update(intent="emergency", contact_option=1, want_to_call=True, want_to_share=True)
+    elif "around" in text or "surrounding" in text or "scene" in text:
+        intent["intent"] = "scene_description"
+    elif "read" in text or "text" in text:
+        intent["intent"] = "ocr"
+    elif "share" in text or "send" in text:
+        intent.update(intent="list_share_contacts", listen_back=True)
+    elif "call" in text or "dial" in text:
+        intent.update(intent="list_contacts", listen_back=True)
+    elif "navigate" in text or "direction" in text:
+        intent["intent"] = "navigation"
+    elif text.strip(" .!") in ("yes", "yeah", "sure", "okay"):
+        intent.update(intent="yes_no_response", response="yes")
+    elif text.strip(" .!") in ("no", "nope", "cancel"):
+        intent.update(intent="yes_no_response", response="no")
+    return intent
+
+
+def scripted_responder(script, fallback=keyword_intent):
+    """
+    Responder that answers from a fixed script
+
+    Args:
+        script: Maps transcripts (matched case-insensitively) to the intent
+                dict to return
+        fallback: Used for transcripts the script does not cover
+    """
+    answers = {transcript.strip().lower(): response for transcript, response in script.items()}
+
+    def respond(transcript):
+        answer = answers.get(transcript.strip().lower())
+        return dict(answer) if answer is not None else fallback(transcript)
+    return respond
+
+
+def completion(content, model, prompt_tokens):
+    completion_tokens = max(1, len(content) // 4)
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": content},
+            "finish_reason": "stop",
+        }],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        },
+    }
+
+
+class RequestBudget:
+    """Per-key fixed-window request budget, reported like Groq's x-ratelimit-* headers"""
+
+    def __init__(self, limit, window_s=60.0):
+        self.limit = limit
+        self.window_s = window_s
+        self.windows = {}  # api key -> (window_start, used)
+
+    def take(self, api_key):
+        """Count one request; returns (allowed, headers)"""
+        now = time.monotonic()
+        start, used = self.windows.get(api_key, (now, 0))
+        if now - start >= self.window_s:
+            start, used = now, 0
+
+        reset = self.window_s - (now - start)
+        allowed = used < self.limit
+        if allowed:
+            used += 1
+        self.windows[api_key] = (start, used)
+
+        headers = {
+            "x-ratelimit-limit-requests": str(self.limit),
+            "x-ratelimit-remaining-requests": str(self.limit - used),
+            "x-ratelimit-reset-requests": f"{reset:.2f}s",
+        }
+        if not allowed:
+            headers["retry-after"] = str(max(1, int(reset + 0.999)))
+        return allowed, headers
+
+
+def create_app(latency_ms=0.0, responder=keyword_intent, requests_per_minute=None,
+               latency_jitter_ms=0.0, rate_limit_probability=0.0, seed=None):
+    """
+    Build the stand-in app
+
+    Args:
+        latency_ms: Delay added before every response
+        responder: Maps a transcript to the intent dict returned as content
+        requests_per_minute: Per-key request budget; over budget returns 429
+        latency_jitter_ms: Extra delay drawn uniformly from [0, jitter] per request
+        rate_limit_probability: Chance of answering any request with an injected 429
+        seed: Seed for jitter and injected 429s so runs are repeatable
+    """
+    app = FastAPI(title="Fake Groq")
+    app.state.requests = 0
+    app.state.requests_by_key = {}
+    app.state.injected_429s = 0
+    budget = RequestBudget(requests_per_minute) if requests_per_minute else None
+    rng = random.Random(seed)
+
+    @app.post("/openai/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        api_key = request.headers.get("authorization", "").removeprefix("Bearer ")
+        app.state.requests += 1
+        app.state.requests_by_key[api_key] = app.state.requests_by_key.get(api_key, 0) + 1
+
+        error = {"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}}
+        headers = {}
+        if budget is not None:
+            allowed, headers = budget.take(api_key)
+            if not allowed:
+                return JSONResponse(status_code=429, content=error, headers=headers)
+        if rate_limit_probability and rng.random() < rate_limit_probability:
+            app.state.injected_429s += 1
+            return JSONResponse(status_code=429, content=error, headers={**headers, "retry-after": "1"})
+
+        delay_ms = latency_ms + (rng.uniform(0, latency_jitter_ms) if latency_jitter_ms else 0.0)
+        if delay_ms:
+            await asyncio.sleep(delay_ms / 1000)
+
+        messages = body.get("messages", [])
+        prompt_tokens = sum(len(m.get("content") or "") for m in messages) // 4
+        content = json.dumps(responder(extract_transcript(messages)))
+        return JSONResponse(content=completion(content, body.get("model", ""), prompt_tokens), headers=headers)
+
+    return app
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class FakeGroqServer:
+    """
+    Runs a stand-in app with uvicorn on a background thread
+
+    with FakeGroqServer(latency_ms=200) as fake:
+        os.environ["GROQ_BASE_URL"] = fake.base_url
+    """
+
+    def __init__(self, port=None, **app_kwargs):
+        self.port = port or free_port()
+        self.app = create_app(**app_kwargs)
+        self.server = uvicorn.Server(uvicorn.Config(self.app, host="127.0.0.1", port=self.port, log_level="warning"))
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.port}"
+
+    def __enter__(self):
+        self.thread.start()
+        while not self.server.started:
+            time.sleep(0.01)
+        return self
+
+    def __exit__(self, *exc):
+        self.server.should_exit = True
+        self.thread.join(timeout=5)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--latency-jitter-ms", type=float, default=0.0)
+    parser.add_argument("--requests-per-minute", type=int, help="Per-key budget before answering 429")
+    parser.add_argument("--rate-limit-probability", type=float, default=0.0, help="Chance of an injected 429")
+    parser.add_argument("--script", help="JSON file mapping transcripts to the intent dict to return")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    responder = keyword_intent
+    if args.script:
+        with open(args.script) as f:
+            responder = scripted_responder(json.load(f))
+    app = create_app(
+        latency_ms=args.latency_ms,
+        responder=responder,
+        requests_per_minute=args.requests_per_minute,
+        latency_jitter_ms=args.latency_jitter_ms,
+        rate_limit_probability=args.rate_limit_probability,
+        seed=args.seed,
+    )
+    uvicorn.run(app, host="127.0.0.1", port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,385 @@
+"""
+Local fast-path intent classifier
+
+Resolves common utterances without an LLM call, in two tiers:
+
+1. Deterministic patterns for yes/no answers, emergencies, option numbers
+   and "call/share with <name>" requests, which also fill the slot fields.
+2. A character-trigram TF-IDF nearest-neighbour model over INTENT_EXAMPLES
+   for slot-free intents (scene description, OCR, list contacts, ...).
+
+Every result uses the same schema as get_user_intent plus a "confidence"
+score. Anything the classifier is unsure about is left to the LLM.
+"""
+import math
+import re
+from collections import Counter
+
+
+def intent_result(intent, listen_back=False, contact_option=None, contact_name=None,
+                  want_to_call=False, want_to_share=False, response=None):
+    return {
+        "intent": intent,
+        "listen_back": listen_back,
+        "contact_option": contact_option,
+        "contact_name": contact_name,
+        "want_to_call": want_to_call,
+        "want_to_share": want_to_share,
+        "response": response,
+    }
+
+
+def list_contacts():
+    return intent_result("list_contacts", listen_back=True)
+
+
+def list_share_contacts():
+    return intent_result("list_share_contacts", listen_back=True)
+
+
+def call_contact(option=None, name=None):
+    return intent_result("call_contact", contact_option=option, contact_name=name, want_to_call=True)
+
+
+def share_location(option=None, name=None):
+    return intent_result("share_location", contact_option=option, contact_name=name, want_to_share=True)
+
+
+def yes_no(answer):
+    return intent_result("yes_no_response", response=answer)
+
+
+def emergency():
+    return intent_result("emergency", contact_option=1, want_to_call=True, want_to_share=True)
+
+
+# The worked examples from the intent prompt, plus seed utterances for the
+# intents the prompt describes only in its rules
+INTENT_EXAMPLES = [
+    ("Show me my contacts", list_contacts()),
+    ("I want to call someone", list_contacts()),
+    ("Call option number 1", call_contact(option=1)),
+    ("Call option number 2", call_contact(option=2)),
+    ("Call option number 3", call_contact(option=3)),
+    ("Call option number 4", call_contact(option=4)),
+    ("Yes", yes_no("yes")),
+    ("No", yes_no("no")),
+    ("Yes, call the first contact", call_contact(option=1)),
+    ("Yes, call the second contact", call_contact(option=2)),
+    ("Yes, call the third contact", call_contact(option=3)),
+    ("Yes, call the fourth contact", call_contact(option=4)),
+    ("Share my location", list_share_contacts()),
+    ("/share", list_share_contacts()),
+    ("Share location with option 1", share_location(option=1)),
+    ("Share location with option number 2", share_location(option=2)),
+    ("Share location with option 3", share_location(option=3)),
+    ("Share location with option 4", share_location(option=4)),
+    ("Share with all contacts", share_location(option=-1)),
+    ("Yes, share my location to option 1", share_location(option=1)),
+    ("Yes, share my location to option 2", share_location(option=2)),
+    ("Yes, share my location to option 3", share_location(option=3)),
+    ("Yes, share my location to option 4", share_location(option=4)),
+    ("Send my location to option 1", share_location(option=1)),
+    ("Send my location to option 2", share_location(option=2)),
+    ("Send my location to option 3", share_location(option=3)),
+    ("Send my location to option 4", share_location(option=4)),
+    ("Yes, I want to share", share_location()),
+    ("No, don't share", yes_no("no")),
+    ("Navigate to home", intent_result("navigation")),
+    ("I need help", emergency()),
+    ("Help me", emergency()),
+    ("It's an emergency", emergency()),
+    ("ALERT FAMILY", emergency()),
+    ("Call Pradeep", call_contact(name="Pradeep")),
+    ("Call home", call_contact(name="home")),
+    ("Dial mom", call_contact(name="mom")),
+    ("Call John please", call_contact(name="John")),
+    ("Phone dad", call_contact(name="dad")),
+    ("Call doctor Smith", call_contact(name="doctor Smith")),
+    ("Ring my brother", call_contact(name="my brother")),
+    ("Call anyone whose name is Rajesh", call_contact(name="Rajesh")),
+    ("Share location with Pradeep", share_location(name="Pradeep")),
+    ("Share my location with home", share_location(name="home")),
+    ("Send location to mom", share_location(name="mom")),
+    ("Share where I am with John", share_location(name="John")),
+    ("Send my location to Prajwal", share_location(name="Prajwal")),
+    ("Share with doctor", share_location(name="doctor")),
+    ("Send location to my brother", share_location(name="my brother")),
+    ("Share my location with anyone named Kumar", share_location(name="Kumar")),
+    # Seeds for intents without worked examples in the prompt
+    ("Connect to my glasses", intent_result("connect_glasses")),
+    ("Connect the glasses", intent_result("connect_glasses")),
+    ("Are my glasses connected", intent_result("connect_glasses")),
+    ("Check the glasses connection", intent_result("connect_glasses")),
+    ("What is this object", intent_result("object_detection")),
+    ("What am I holding", intent_result("object_detection")),
+    ("Identify this object", intent_result("object_detection")),
+    ("What's around me", intent_result("scene_description")),
+    ("Describe my surroundings", intent_result("scene_description")),
+    ("What is happening around me", intent_result("scene_description")),
+    ("Describe the scene", intent_result("scene_description")),
+    ("Tell me what you see", intent_result("scene_description")),
+    ("What do you see", intent_result("scene_description")),
+    ("What's in front of me", intent_result("scene_description")),
+    ("Read this", intent_result("ocr")),
+    ("Read the sign", intent_result("ocr")),
+    ("Read the text", intent_result("ocr")),
+    ("What does this say", intent_result("ocr")),
+    ("Read the board", intent_result("ocr")),
+    ("Read that for me", intent_result("ocr")),
+    ("Take me to the bus stop", intent_result("navigation")),
+    ("Give me directions to the market", intent_result("navigation")),
+    ("Guide me to the station", intent_result("navigation")),
+    ("Open settings", intent_result("settings")),
+    ("Take me to settings", intent_result("settings")),
+    ("Go to settings", intent_result("settings")),
+    ("List my contacts", list_contacts()),
+    ("Who can I call", list_contacts()),
+    ("Make a call", list_contacts()),
+    ("Send my location", list_share_contacts()),
+    ("Share where I am", list_share_contacts()),
+    ("Share my current location", list_share_contacts()),
+]
+
+YES_WORDS = {"yes", "yeah", "yep", "yup", "sure", "okay", "ok", "absolutely", "yes please", "of course"}
+NO_WORDS = {
+    "no", "nope", "nah", "not now", "dont", "don't", "cancel", "no thanks", "no thank you",
+    "no don't", "no dont", "no don't share", "no dont share", "no don't call", "no dont call",
+}
+
+EMERGENCY_PATTERN = re.compile(
+    r"^(?:please )?(?:help|help me|somebody help(?: me)?|someone help(?: me)?|i need help|"
+    r"i need help now|call for help|emergency|it'?s an emergency|this is an emergency|"
+    r"alert (?:my )?family|sos)(?: please| now)?$"
+)
+
+# Words that make an utterance worth treating as a possible emergency even
+# when it does not match EMERGENCY_PATTERN exactly
+URGENT_WORDS = re.compile(
+    r"\b(?:help|emergency|alert|sos|danger|dangerous|hurt|injured|bleeding|fell|fallen|accident|"
+    r"ambulance|police|fire|attack|attacked|unsafe|scared|lost)\b"
+)
+
+NUMBER_WORDS = {
+    "one": 1, "two": 2, "three": 3, "four": 4, "five": 5,
+    "six": 6, "seven": 7, "eight": 8, "nine": 9, "ten": 10,
+    "first": 1, "second": 2, "third": 3, "fourth": 4, "fifth": 5,
+    "sixth": 6, "seventh": 7, "eighth": 8, "ninth": 9, "tenth": 10,
+    "1st": 1, "2nd": 2, "3rd": 3, "4th": 4, "5th": 5,
+}
+NUMBER = r"(\d+|" + "|".join(NUMBER_WORDS) + r")"
+
+# "option 2", "option number 2", "number 2", "contact 2", "the second contact", "the second one",
+# or just "2" / "two"
+OPTION_PATTERN = re.compile(
+    r"^(?:(?:option|contact)\s+(?:number\s+)?|number\s+|the\s+)?" + NUMBER +
+    r"(?:\s+(?:contact|one|option))?$"
+)
+
+REQUEST_PREFIX = r"^(?:yes\s+)?(?:(?:please|can you|could you|i want to|i would like to|i'd like to)\s+)?"
+CALL_PATTERN = re.compile(REQUEST_PREFIX + r"(?:call|dial|phone|ring)\s+(.+?)(?:\s+please)?$", re.IGNORECASE)
+SHARE_PATTERN = re.compile(
+    REQUEST_PREFIX + r"(?:share|send)\s+(?:my\s+)?(?:current\s+)?(?:location\s+|where i am\s+)?"
+    r"(?:with|to)\s+(.+?)(?:\s+please)?$",
+    re.IGNORECASE,
+)
+# "dial 100", "call 911": a phone number rather than a contact option
+PHONE_NUMBER_PATTERN = re.compile(r"^\+?\d[\d ]{2,}$")
+NAMED_PATTERN = re.compile(r"^(?:anyone|someone|the contact|contact)\s+(?:whose name is|named|called)\s+(.+)$",
+                           re.IGNORECASE)
+
+UNSPECIFIED_CALL_TARGETS = {"someone", "somebody", "anyone", "a contact", "contact", "my contacts", "a friend"}
+UNSPECIFIED_SHARE_TARGETS = {"someone", "somebody", "contacts", "my contacts", "a contact"}
+# "call me a taxi", "call for a doctor": not a contact, leave to the LLM
+# "call option to" (misheard number): also the LLM's call
+NON_CONTACT_PREFIXES = ("me ", "for ", "back", "it ", "this ", "option", "number")
+ALL_SHARE_TARGETS = {"all", "everyone", "everybody", "all contacts", "all my contacts", "all of them"}
+
+
+# Returned by match_rules when the similarity tier must not guess either
+UNRESOLVED = (None, 0.0)
+
+
+def normalize(text):
+    """Lowercase, unify apostrophes, drop punctuation (except ' and /) and collapse spaces"""
+    text = text.lower().replace("’", "'")
+    text = re.sub(r"[^a-z0-9'/ ]+", " ", text)
+    return " ".join(text.split())
+
+
+def looks_urgent(text):
+    """Cheap check for utterances that may be emergencies; errs on the side of yes"""
+    return URGENT_WORDS.search(normalize(text)) is not None
+
+
+def clean(text):
+    """Like normalize but keeps the user's casing, for extracting contact names"""
+    text = text.replace("’", "'")
+    text = re.sub(r"[^A-Za-z0-9'/ ]+", " ", text)
+    return " ".join(text.split())
+
+
+def parse_option(target):
+    match = OPTION_PATTERN.match(target.lower())
+    if not match:
+        return None
+    value = match.group(1)
+    return int(value) if value.isdigit() else NUMBER_WORDS[value]
+
+
+def trigrams(text):
+    padded = f"  {text} "
+    return Counter(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+class TrigramIndex:
+    """Character-trigram TF-IDF vectors over a fixed list of texts, scored by cosine"""
+
+    def __init__(self, texts):
+        grams = [trigrams(normalize(text)) for text in texts]
+        document_frequency = Counter(gram for counts in grams for gram in counts)
+        total = len(grams)
+        self.idf = {gram: math.log((1 + total) / (1 + df)) + 1 for gram, df in document_frequency.items()}
+        # Grams no indexed text has get the weight of the rarest possible gram,
+        # so unknown words in a query dilute its similarity instead of vanishing
+        self.unseen_idf = math.log(1 + total) + 1
+        self.vectors = [self.vectorize(counts) for counts in grams]
+
+    def vectorize(self, counts):
+        vector = {gram: count * self.idf.get(gram, self.unseen_idf) for gram, count in counts.items()}
+        norm = math.sqrt(sum(value * value for value in vector.values())) or 1.0
+        return {gram: value / norm for gram, value in vector.items()}
+
+    def scores(self, text):
+        """Cosine similarity of text to every indexed text, in index order"""
+        query = self.vectorize(trigrams(normalize(text)))
+        if not query:
+            return []
+        return [sum(weight * vector.get(gram, 0.0) for gram, weight in query.items()) for vector in self.vectors]
+
+
+class IntentClassifier:
+    """
+    Rule + nearest-neighbour intent classifier
+
+    classify() returns an intent dict with a "confidence" key, or None when
+    the best guess is below min_confidence and the LLM should decide.
+    """
+
+    # Intents whose slots the similarity tier cannot fill, or where a wrong
+    # guess is costly; these are only resolved by rules or the LLM
+    RULE_ONLY_INTENTS = {"emergency", "yes_no_response", "call_contact"}
+
+    def __init__(self, examples=INTENT_EXAMPLES, min_confidence=0.85, min_margin=0.1):
+        self.min_confidence = min_confidence
+        self.min_margin = min_margin
+        self.hits = 0
+        self.fallbacks = 0
+
+        self.examples = [
+            (utterance, result) for utterance, result in examples
+            if result["intent"] not in self.RULE_ONLY_INTENTS
+            and result["contact_option"] is None and result["contact_name"] is None
+        ]
+        self.index = TrigramIndex([utterance for utterance, _ in self.examples])
+
+    def match_rules(self, text):
+        """
+        Deterministic patterns; returns (result, confidence), UNRESOLVED when a
+        call/share request was recognized but its target could not be parsed,
+        is a phone number ("dial 100") or it may be an emergency ("call an
+        ambulance"), or None when no pattern applies
+        """
+        normalized = normalize(text)
+        if not normalized:
+            return None
+
+        if normalized in YES_WORDS:
+            return yes_no("yes"), 1.0
+        if normalized in NO_WORDS:
+            return yes_no("no"), 1.0
+        if EMERGENCY_PATTERN.match(normalized):
+            return emergency(), 1.0
+        if normalized == "/share":
+            return list_share_contacts(), 1.0
+
+        cleaned = clean(text)
+        match = CALL_PATTERN.match(cleaned)
+        if match:
+            if looks_urgent(text):
+                return UNRESOLVED
+            target = match.group(1)
+            if PHONE_NUMBER_PATTERN.match(target):
+                return UNRESOLVED
+            option = parse_option(target)
+            if option is not None:
+                return call_contact(option=option), 0.95
+            if target.lower() in UNSPECIFIED_CALL_TARGETS:
+                return list_contacts(), 0.9
+            if target.lower().startswith(NON_CONTACT_PREFIXES):
+                return UNRESOLVED
+            named = NAMED_PATTERN.match(target)
+            return call_contact(name=named.group(1) if named else target), 0.9
+
+        match = SHARE_PATTERN.match(cleaned)
+        if match:
+            if looks_urgent(text):
+                return UNRESOLVED
+            target = match.group(1)
+            if PHONE_NUMBER_PATTERN.match(target):
+                return UNRESOLVED
+            option = parse_option(target)
+            if option is not None:
+                return share_location(option=option), 0.95
+            if target.lower() in ALL_SHARE_TARGETS:
+                return share_location(option=-1), 0.95
+            if target.lower() in UNSPECIFIED_SHARE_TARGETS:
+                return list_share_contacts(), 0.9
+            if target.lower().startswith(NON_CONTACT_PREFIXES):
+                return UNRESOLVED
+            named = NAMED_PATTERN.match(target)
+            return share_location(name=named.group(1) if named else target), 0.9
+
+        return None
+
+    def match_similar(self, text):
+        """Nearest example by trigram TF-IDF cosine; returns (result, confidence) or None"""
+        best = {}
+        for (_, result), score in zip(self.examples, self.index.scores(text)):
+            intent = result["intent"]
+            if score > best.get(intent, (0.0, None))[0]:
+                best[intent] = (score, result)
+        if not best:
+            return None
+
+        ranked = sorted(best.values(), key=lambda item: item[0], reverse=True)
+        score, result = ranked[0]
+        runner_up = ranked[1][0] if len(ranked) > 1 else 0.0
+        if score - runner_up < self.min_margin:
+            return None
+        return dict(result), score
+
+    def classify(self, text):
+        match = self.match_rules(text)
+        # An urgent utterance that is not a plain emergency ("what is around
+        # me, help") may still be one; only the LLM gets to decide that
+        if match is None and looks_urgent(text):
+            match = UNRESOLVED
+        if match is None:
+            match = self.match_similar(text)
+        if match is None or match[0] is None or match[1] < self.min_confidence:
+            self.fallbacks += 1
+            return None
+
+        self.hits += 1
+        result, confidence = match
+        return {**result, "confidence": round(confidence, 3)}
+
+    def stats(self):
+        total = self.hits + self.fallbacks
+        return {
+            "min_confidence": self.min_confidence,
+            "hits": self.hits,
+            "fallbacks": self.fallbacks,
+            "hit_rate": (self.hits / total) if total else 0.0,
+        }
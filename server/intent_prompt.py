@@ -0,0 +1,105 @@
+"""
+Compact intent prompt with per-request few-shot examples
+
+The static instructions live in one system message that is identical for
+every request. Instead of resending every worked example, only the k
+examples most similar to the transcript (trigram TF-IDF over
+INTENT_EXAMPLES) are added, as user/assistant turns ahead of the real one.
+"""
+import json
+import threading
+
+from intent_classifier import INTENT_EXAMPLES, TrigramIndex
+
+INTENT_SYSTEM_PROMPT = """You identify the intent of a voice command for a navigation assistant for blind users.
+
+Pick exactly ONE intent: connect_glasses, object_detection, scene_description, ocr, navigation, list_contacts, call_contact, list_share_contacts, share_location, yes_no_response, emergency, settings.
+
+Reply with only this JSON object, no explanations or extra keys, lowercase true/false/null:
+{"intent": "<intent>", "listen_back": true|false, "contact_option": null|<integer>, "contact_name": null|"<name>", "want_to_call": true|false, "want_to_share": true|false, "response": "yes"|"no"|null}
+
+Intents:
+- connect_glasses: connect to the glasses or check the connection
+- ocr: read text, letters, signs or boards
+- scene_description: what is happening in the surroundings
+- object_detection: asking about a specific item or thing
+- navigation: directions, movement or path guidance
+- emergency: asks for help, emergency or to alert family -> contact_option 1, want_to_call true, want_to_share true
+- settings: open or go to settings
+- yes_no_response: a plain yes (yes, yeah, sure, okay, yep, absolutely) or no (no, nope, nah, not now, don't, cancel) -> response "yes"/"no", all other fields null/false
+
+Calls:
+- list_contacts (listen_back true): asks for contacts or wants to call without naming anyone ("who can I call", "call someone")
+- call_contact (want_to_call true): "call option 2", "call the second" -> contact_option 2; "call/dial/phone/ring <name>" -> contact_name with the exact words spoken, e.g. "ring my brother" -> "my brother"; a confirmation after hearing a contact -> that contact_option
+
+Location sharing:
+- list_share_contacts (listen_back true): wants to share location without naming a recipient ("share my location", "/share")
+- share_location (want_to_share true): "share with option 1", "send to the first" -> contact_option 1; "share with all/everyone" -> contact_option -1; "share/send location with/to <name>" -> contact_name with the exact words spoken; a confirmation after hearing a contact -> that contact_option
+
+contact_name is never validated; extract whatever name or entity follows the action verb, including titles and multiple words. listen_back true means confirm before acting."""
+
+
+def estimate_tokens(text):
+    """Rough token count (about 4 characters per token) for prompts we have not sent yet"""
+    return max(1, len(text) // 4)
+
+
+class IntentPrompt:
+    """
+    Builds chat messages for the intent LLM and accounts for their token cost
+
+    Examples are picked by similarity, at most per_intent from any one
+    intent so near-duplicates (option 1..4) do not crowd out the rest.
+    """
+
+    def __init__(self, examples=INTENT_EXAMPLES, k=6, per_intent=2):
+        self.examples = list(examples)
+        self.k = k
+        self.per_intent = per_intent
+        self.index = TrigramIndex([utterance for utterance, _ in self.examples])
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+
+    def select_examples(self, text):
+        scores = self.index.scores(text)
+        ranked = sorted(range(len(scores)), key=lambda i: scores[i], reverse=True)
+        selected = []
+        per_intent = {}
+        for i in ranked:
+            if len(selected) >= self.k:
+                break
+            intent = self.examples[i][1]["intent"]
+            if per_intent.get(intent, 0) >= self.per_intent:
+                continue
+            per_intent[intent] = per_intent.get(intent, 0) + 1
+            selected.append(self.examples[i])
+        # Most similar example last, closest to the real question
+        return selected[::-1]
+
+    def build_messages(self, text):
+        messages = [{"role": "system", "content": INTENT_SYSTEM_PROMPT}]
+        for utterance, result in self.select_examples(text):
+            messages.append({"role": "user", "content": f'Text: "{utterance}"'})
+            messages.append({"role": "assistant", "content": json.dumps(result)})
+        messages.append({"role": "user", "content": f'Text: "{text}"'})
+        return messages
+
+    def record_usage(self, prompt_tokens, completion_tokens):
+        with self.lock:
+            self.requests += 1
+            self.prompt_tokens += prompt_tokens
+            self.completion_tokens += completion_tokens
+
+    def stats(self):
+        with self.lock:
+            requests = self.requests
+            return {
+                "examples_per_request": self.k,
+                "system_prompt_tokens_est": estimate_tokens(INTENT_SYSTEM_PROMPT),
+                "requests": requests,
+                "prompt_tokens": self.prompt_tokens,
+                "completion_tokens": self.completion_tokens,
+                "avg_prompt_tokens": (self.prompt_tokens / requests) if requests else 0.0,
+            }
@@ -0,0 +1,176 @@
+"""
+Groq key health shared between worker processes
+
+Every uvicorn worker has its own GroqKeyManager. With a SharedKeyStore they
+all read and write the same SQLite file, so a 429 or an exhausted budget
+seen by one worker makes every worker skip that key, and in-flight calls of
+other workers count toward a key's load.
+
+Callers pass and get time.monotonic() values, but the file holds wall-clock
+times: it outlives reboots, which reset the monotonic clock, and a park
+stored before one must read as expired after it rather than as far in the
+future. Keys are stored by a hash, never in clear.
+
+Calls run on the event loop, so after setup a locked database is only
+waited on for busy_timeout_ms; callers treat the resulting sqlite3.Error as
+"shared state unavailable" and carry on with their local view.
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS key_budget (
+    key_id TEXT PRIMARY KEY,
+    remaining_requests INTEGER,
+    requests_reset_at REAL NOT NULL DEFAULT 0,
+    remaining_tokens INTEGER,
+    tokens_reset_at REAL NOT NULL DEFAULT 0,
+    parked_until REAL NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS key_in_flight (
+    key_id TEXT NOT NULL,
+    pid INTEGER NOT NULL,
+    in_flight INTEGER NOT NULL,
+    PRIMARY KEY (key_id, pid)
+);
+"""
+
+
+def key_id(api_key):
+    return hashlib.sha256(api_key.encode()).hexdigest()[:16]
+
+
+def to_wall_clock(monotonic_time):
+    # 0 means "never set" and is stored as is
+    return monotonic_time + time.time() - time.monotonic() if monotonic_time else 0.0
+
+
+def to_monotonic(wall_time):
+    return wall_time - time.time() + time.monotonic() if wall_time else 0.0
+
+
+def pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class SharedKeyStore:
+    """SQLite-backed budget, parking and in-flight counts per API key"""
+
+    def __init__(self, path, api_keys, busy_timeout_ms=20):
+        self.path = path
+        self.key_ids = [key_id(api_key) for api_key in api_keys]
+        self.busy_timeout_ms = busy_timeout_ms
+        self.lock = threading.Lock()
+        self.pid = None
+        self.connection = None
+        self._connect()
+
+    def _connect(self):
+        pid = os.getpid()
+        # Setup may wait for other workers starting at the same time
+        connection = sqlite3.connect(self.path, timeout=1.0, isolation_level=None, check_same_thread=False)
+        try:
+            # State is advisory and rebuilt from response headers, so
+            # durability is traded for speed: WAL, no fsync
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=OFF")
+            connection.executescript(SCHEMA)
+            connection.executemany(
+                "INSERT OR IGNORE INTO key_budget (key_id) VALUES (?)", [(kid,) for kid in self.key_ids]
+            )
+            # Rows left behind by an earlier process with the same pid
+            connection.execute("DELETE FROM key_in_flight WHERE pid = ?", (pid,))
+            connection.execute(f"PRAGMA busy_timeout = {int(self.busy_timeout_ms)}")
+        except sqlite3.Error:
+            connection.close()
+            raise
+        self.connection, self.pid = connection, pid
+
+    def _db(self):
+        # A connection must not cross a fork (e.g. workers forked from a preloaded app)
+        if os.getpid() != self.pid:
+            self._connect()
+        return self.connection
+
+    def load(self):
+        """
+        Returns:
+            list: One dict per key, in api_keys order, with the shared budget
+                  fields and other_in_flight (calls in flight in other workers)
+        """
+        with self.lock:
+            budgets = {
+                row[0]: row for row in self._db().execute(
+                    "SELECT key_id, remaining_requests, requests_reset_at, remaining_tokens, "
+                    "tokens_reset_at, parked_until FROM key_budget"
+                )
+            }
+            other_in_flight = {}
+            dead = set()
+            for kid, pid, count in self.connection.execute(
+                "SELECT key_id, pid, in_flight FROM key_in_flight WHERE pid != ? AND in_flight > 0", (self.pid,)
+            ):
+                if pid in dead or not pid_alive(pid):
+                    dead.add(pid)
+                    continue
+                other_in_flight[kid] = other_in_flight.get(kid, 0) + count
+            if dead:
+                self.connection.executemany("DELETE FROM key_in_flight WHERE pid = ?", [(pid,) for pid in dead])
+
+        states = []
+        for kid in self.key_ids:
+            _, remaining_requests, requests_reset_at, remaining_tokens, tokens_reset_at, parked_until = budgets[kid]
+            states.append({
+                "remaining_requests": remaining_requests,
+                "requests_reset_at": to_monotonic(requests_reset_at),
+                "remaining_tokens": remaining_tokens,
+                "tokens_reset_at": to_monotonic(tokens_reset_at),
+                "parked_until": to_monotonic(parked_until),
+                "other_in_flight": other_in_flight.get(kid, 0),
+            })
+        return states
+
+    def record_budget(self, index, remaining_requests, requests_reset_at, remaining_tokens, tokens_reset_at):
+        """Store the budget from the newest response; fields that were not reported are left alone"""
+        if requests_reset_at is not None:
+            requests_reset_at = to_wall_clock(requests_reset_at)
+        if tokens_reset_at is not None:
+            tokens_reset_at = to_wall_clock(tokens_reset_at)
+        with self.lock:
+            self._db().execute(
+                "UPDATE key_budget SET "
+                "remaining_requests = COALESCE(?, remaining_requests), "
+                "requests_reset_at = COALESCE(?, requests_reset_at), "
+                "remaining_tokens = COALESCE(?, remaining_tokens), "
+                "tokens_reset_at = COALESCE(?, tokens_reset_at) "
+                "WHERE key_id = ?",
+                (remaining_requests, requests_reset_at, remaining_tokens, tokens_reset_at, self.key_ids[index])
+            )
+
+    def park(self, index, until):
+        with self.lock:
+            self._db().execute(
+                "UPDATE key_budget SET parked_until = MAX(parked_until, ?) WHERE key_id = ?",
+                (to_wall_clock(until), self.key_ids[index])
+            )
+
+    def set_in_flight(self, index, count):
+        with self.lock:
+            self._db().execute(
+                "INSERT OR REPLACE INTO key_in_flight (key_id, pid, in_flight) VALUES (?, ?, ?)",
+                (self.key_ids[index], self.pid, count)
+            )
+
+    def close(self):
+        with self.lock:
+            self.connection.execute("DELETE FROM key_in_flight WHERE pid = ?", (self.pid,))
+            self.connection.close()
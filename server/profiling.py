@@ -0,0 +1,57 @@
+"""
+Sampling profiler for live workers
+
+A background thread snapshots the Python stacks of every thread at a fixed
+interval and counts identical stacks. The result is written in the
+"folded" format (frame;frame;frame count per line) read by flamegraph.pl,
+speedscope and most other flame graph tools. Nothing runs, and nothing is
+hooked into the interpreter, unless a capture is active.
+"""
+import os
+import sys
+import threading
+from collections import Counter
+
+
+def frame_label(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    """Samples all thread stacks every interval_s seconds between start() and stop()"""
+
+    def __init__(self, interval_s=0.005, max_depth=128):
+        self.interval_s = interval_s
+        self.max_depth = max_depth
+        self.stacks = Counter()
+        self.samples = 0
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self.stop_event.wait(self.interval_s):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < self.max_depth:
+                    stack.append(frame_label(frame))
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, f"thread-{thread_id}"))
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def folded(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
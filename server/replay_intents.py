@@ -0,0 +1,232 @@
+"""
+Offline replay of labeled transcripts through the intent pipeline
+
+Runs every transcript in a labeled corpus through POST /get_user_intent of
+the real app (in-process, including the local fast path, the intent cache
+and the key scheduler) against a local Groq stand-in, then reports:
+
+- accuracy overall and per expected intent
+- agreement on contact_name / contact_option where the corpus labels them
+- latency percentiles, overall and split by local vs LLM resolution
+- how the Groq calls were spread over the keys (attempts, 429s, rotations)
+
+The stand-in answers either with each transcript's own label ("oracle", so
+every mismatch comes from our side of the pipeline), with its keyword
+heuristic ("keyword"), or from a --script file. Point --groq-url at another
+endpoint to replay against it instead of the stand-in.
+
+Usage:
+    python replay_intents.py [--corpus intent_corpus.jsonl] [--stand-in oracle|keyword]
+                             [--groq-latency-ms 300] [--rate-limit-probability 0.1] [--json out.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+from contextlib import nullcontext
+
+import httpx
+
+from benchmark import percentile
+from fake_groq import EMPTY_INTENT, FakeGroqServer, keyword_intent, scripted_responder
+
+SERVER_DIR = os.path.dirname(os.path.abspath(__file__))
+SLOT_FIELDS = ("contact_name", "contact_option")
+
+
+def load_corpus(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def oracle_script(corpus):
+    """Stand-in script answering each corpus transcript with its label"""
+    return {item["text"]: {**EMPTY_INTENT, **item["expected"]} for item in corpus}
+
+
+def same_value(expected, actual):
+    if isinstance(expected, str) and isinstance(actual, str):
+        return expected.strip().lower() == actual.strip().lower()
+    return expected == actual
+
+
+async def replay(corpus, concurrency, passes):
+    # Imported here so the environment set up in main() is in place first
+    import server
+
+    semaphore = asyncio.Semaphore(concurrency)
+    results = []
+
+    async with server.app.router.lifespan_context(server.app):
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://replay", timeout=60) as client:
+
+            async def run(item):
+                async with semaphore:
+                    started = time.perf_counter()
+                    response = await client.post("/get_user_intent", json={"audioText": item["text"]})
+                    latency = time.perf_counter() - started
+                body = response.json() if response.headers.get("content-type", "").startswith("application/json") else {}
+                results.append({"item": item, "status": response.status_code, "body": body, "latency": latency})
+
+            for _ in range(passes):
+                await asyncio.gather(*(run(item) for item in corpus))
+            status = (await client.get("/api-status")).json()
+
+    return results, status
+
+
+def latency_summary(latencies):
+    ordered = sorted(latency * 1000 for latency in latencies)
+    return {
+        "count": len(ordered),
+        "p50_ms": percentile(ordered, 0.50),
+        "p95_ms": percentile(ordered, 0.95),
+        "p99_ms": percentile(ordered, 0.99),
+        "max_ms": ordered[-1] if ordered else None,
+    }
+
+
+def score(results):
+    per_intent = {}
+    fields = {field: {"labeled": 0, "agree": 0} for field in SLOT_FIELDS}
+    statuses = {}
+    mismatches = []
+    by_source = {"local": [], "llm": [], "failed": []}
+
+    for result in results:
+        expected, body = result["item"]["expected"], result["body"]
+        statuses[str(result["status"])] = statuses.get(str(result["status"]), 0) + 1
+        if result["status"] != 200:
+            by_source["failed"].append(result["latency"])
+        else:
+            by_source["local" if "confidence" in body else "llm"].append(result["latency"])
+
+        bucket = per_intent.setdefault(expected["intent"], {"total": 0, "correct": 0})
+        bucket["total"] += 1
+        correct = result["status"] == 200 and body.get("intent") == expected["intent"]
+        bucket["correct"] += correct
+
+        for field in SLOT_FIELDS:
+            if field in expected:
+                fields[field]["labeled"] += 1
+                fields[field]["agree"] += result["status"] == 200 and same_value(expected[field], body.get(field))
+        if not correct or any(field in expected and not same_value(expected[field], body.get(field))
+                              for field in SLOT_FIELDS):
+            mismatches.append({"text": result["item"]["text"], "expected": expected,
+                               "status": result["status"], "got": body})
+
+    total = len(results)
+    correct = sum(bucket["correct"] for bucket in per_intent.values())
+    for bucket in per_intent.values():
+        bucket["accuracy"] = bucket["correct"] / bucket["total"]
+    for counts in fields.values():
+        counts["agreement"] = (counts["agree"] / counts["labeled"]) if counts["labeled"] else None
+
+    return {
+        "requests": total,
+        "accuracy": correct / total if total else 0.0,
+        "statuses": statuses,
+        "per_intent": dict(sorted(per_intent.items())),
+        "fields": fields,
+        "latency": latency_summary([result["latency"] for result in results]),
+        "latency_by_source": {source: latency_summary(values) for source, values in by_source.items() if values},
+        "mismatches": mismatches,
+    }
+
+
+def key_usage(status):
+    keys = status.get("keys", [])
+    hedging = status.get("intent_hedging") or {}
+    return {
+        "per_key": {f"key{key['key']}": {"requests": key["requests"], "rate_limited": key["rate_limited"]}
+                    for key in keys},
+        "attempts": sum(key["requests"] for key in keys),
+        "rate_limited": sum(key["rate_limited"] for key in keys),
+        "hedges_sent": hedging.get("hedges_sent", 0),
+        "rotations": status.get("key_rotations", 0),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", default=os.path.join(SERVER_DIR, "intent_corpus.jsonl"))
+    parser.add_argument("--stand-in", choices=("oracle", "keyword"), default="oracle",
+                        help="How the Groq stand-in answers transcripts")
+    parser.add_argument("--script", help="JSON file mapping transcripts to stand-in answers (overrides --stand-in)")
+    parser.add_argument("--groq-url", help="Replay against this endpoint instead of the stand-in")
+    parser.add_argument("--groq-latency-ms", type=float, default=300.0)
+    parser.add_argument("--latency-jitter-ms", type=float, default=0.0)
+    parser.add_argument("--rate-limit-probability", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--keys", type=int, default=2, help="Number of stand-in API keys")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--passes", type=int, default=1, help="Times to replay the corpus (later passes may hit the cache)")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE",
+                        help="Extra server environment, e.g. INTENT_FASTPATH=0")
+    parser.add_argument("--show-mismatches", action="store_true")
+    parser.add_argument("--json", help="Write the full report to this file")
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus)
+    if args.script:
+        with open(args.script) as f:
+            responder = scripted_responder(json.load(f))
+    elif args.stand_in == "oracle":
+        responder = scripted_responder(oracle_script(corpus))
+    else:
+        responder = keyword_intent
+
+    stand_in = None if args.groq_url else FakeGroqServer(
+        latency_ms=args.groq_latency_ms,
+        responder=responder,
+        latency_jitter_ms=args.latency_jitter_ms,
+        rate_limit_probability=args.rate_limit_probability,
+        seed=args.seed,
+    )
+
+    with stand_in or nullcontext():
+        os.environ["SERVER_ROLE"] = "intent"
+        os.environ["GROQ_BASE_URL"] = args.groq_url or stand_in.base_url
+        if stand_in is not None:
+            os.environ["GROQ_API_KEY"] = "replay-key0"
+            for i in range(1, args.keys):
+                os.environ[f"GROQ_API_KEY{i}"] = f"replay-key{i}"
+        os.environ.update(dict(item.split("=", 1) for item in args.env))
+
+        results, status = asyncio.run(replay(corpus, args.concurrency, args.passes))
+
+    report = score(results)
+    report["keys"] = key_usage(status)
+    if stand_in is not None:
+        report["stand_in"] = {
+            "requests": stand_in.app.state.requests,
+            "injected_429s": stand_in.app.state.injected_429s,
+        }
+    report["config"] = {key: value for key, value in vars(args).items() if key not in ("json", "show_mismatches")}
+
+    print(f"accuracy {report['accuracy']:.3f} over {report['requests']} requests  statuses {report['statuses']}")
+    for intent, bucket in report["per_intent"].items():
+        print(f"  {intent:<20} {bucket['correct']:>3}/{bucket['total']:<3} {bucket['accuracy']:.2f}")
+    for field, counts in report["fields"].items():
+        if counts["labeled"]:
+            print(f"  {field:<20} agreement {counts['agreement']:.2f} ({counts['agree']}/{counts['labeled']})")
+    for source, latency in report["latency_by_source"].items():
+        print(f"  latency {source:<6} n={latency['count']:<4} p50={latency['p50_ms']:.1f} "
+              f"p95={latency['p95_ms']:.1f} p99={latency['p99_ms']:.1f} ms")
+    keys = report["keys"]
+    print(f"  keys attempts={keys['attempts']} rate_limited={keys['rate_limited']} "
+          f"rotations={keys['rotations']} hedges={keys['hedges_sent']} per_key={keys['per_key']}")
+    if args.show_mismatches:
+        for mismatch in report["mismatches"]:
+            print(f"  MISMATCH {mismatch['text']!r}: expected {mismatch['expected']} "
+                  f"got {mismatch['status']} {mismatch['got']}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
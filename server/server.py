@@ -1,18 +1,36 @@
 
-from fastapi import FastAPI, UploadFile, File, HTTPException, Request
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 import tempfile
 import os
 import json
+import math
+import re
 from dotenv import load_dotenv
-from groq import Groq
-from groq import RateLimitError, APIError
+from groq import AsyncGroq, DefaultAsyncHttpxClient
+from groq import RateLimitError, APIConnectionError, APIError
+import httpx
 import logging
-from transformers import BlipProcessor, BlipForConditionalGeneration
+from intent_classifier import IntentClassifier, looks_urgent, normalize as normalize_transcript
+from intent_prompt import IntentPrompt, estimate_tokens
+from key_store import SharedKeyStore
+from metrics import MetricsRegistry
+from profiling import SamplingProfiler
 from PIL import Image
-import torch
 import io
+import asyncio
+import time
+import hashlib
+import hmac
+import sqlite3
+import zipfile
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import List, Optional
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
@@ -21,7 +39,30 @@ logger = logging.getLogger(__name__)
 # Load environment variables
 load_dotenv()
 
-app = FastAPI(title="ClassEcho")
+# Server role: "intent" serves /get_user_intent only, "caption" serves /caption
+# only, "both" serves everything. torch and transformers are only imported,
+# and the caption model only loaded, by roles that serve captions.
+SERVER_ROLE = os.environ.get("SERVER_ROLE", "both").lower()
+if SERVER_ROLE not in ("intent", "caption", "both"):
+    raise ValueError(f"SERVER_ROLE must be intent, caption or both, got '{SERVER_ROLE}'")
+SERVES_INTENT = SERVER_ROLE in ("intent", "both")
+SERVES_CAPTION = SERVER_ROLE in ("caption", "both")
+
+
+@asynccontextmanager
+async def lifespan(app):
+    if SERVES_CAPTION:
+        # Load in the background so the worker starts answering health checks
+        # immediately; /ready reports when the model is warm
+        asyncio.get_running_loop().run_in_executor(inference_executor, load_and_warm_caption_model)
+    lag_task = asyncio.create_task(loop_lag_monitor.run())
+    yield
+    lag_task.cancel()
+    if key_manager is not None:
+        await key_manager.aclose()
+
+
+app = FastAPI(title="ClassEcho", lifespan=lifespan)
 
 # CORS middleware
 app.add_middleware(
@@ -32,26 +73,1269 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-device = "cuda" if torch.cuda.is_available() else "cpu"
-processor = BlipProcessor.from_pretrained("Salesforce/blip-image-captioning-large")
-model = BlipForConditionalGeneration.from_pretrained("Salesforce/blip-image-captioning-large").to(device)
+# ==========================================
+# METRICS
+# ==========================================
+metrics = MetricsRegistry()
+caption_stage_seconds = metrics.histogram(
+    "classecho_caption_stage_seconds", "Time spent in each /caption processing stage", ["stage"]
+)
+intent_stage_seconds = metrics.histogram(
+    "classecho_intent_stage_seconds", "Time spent in each LLM intent stage", ["stage"]
+)
+admission_queue_seconds = metrics.histogram(
+    "classecho_admission_queue_seconds", "Time requests waited for admission", ["priority"]
+)
+groq_rate_limited_total = metrics.counter(
+    "classecho_groq_rate_limited_total", "429 responses received from Groq", ["key"]
+)
+groq_key_rotations_total = metrics.counter(
+    "classecho_groq_key_rotations_total", "Intent calls moved to another key after a rate limit"
+)
+intent_parse_fallbacks_total = metrics.counter(
+    "classecho_intent_parse_fallbacks_total", "LLM intent answers replaced by a fallback result", ["result"]
+)
+caption_tier_total = metrics.counter(
+    "classecho_caption_tier_total", "Captions generated by each model tier", ["tier"]
+)
+assist_speculation_total = metrics.counter(
+    "classecho_assist_speculation_total", "Speculative /assist captions by outcome", ["outcome"]
+)
+
+# ==========================================
+# CAPTION MODEL LOADING
+# ==========================================
+# Caption model precision: fp32, int8 (dynamic quantization) or bf16
+CAPTION_PRECISION = os.environ.get("CAPTION_PRECISION", "fp32")
+# Directory for weights memory-mapped by every worker, so N uvicorn workers
+# share one read-only copy of the model (unset: each worker loads its own)
+CAPTION_SHARED_WEIGHTS_DIR = os.environ.get("CAPTION_SHARED_WEIGHTS_DIR")
+# Optional second, smaller model (e.g. Salesforce/blip-image-captioning-base)
+# served as the "fast" tier when the server is busy or a request's latency
+# budget is too tight for the large model (unset: the large model only)
+CAPTION_FAST_MODEL = os.environ.get("CAPTION_FAST_MODEL", "")
+
+processor = None
+model = None
+device = None
+caption_precision = None
+fast_processor = None
+fast_model = None
+caption_status = {
+    "state": "pending" if SERVES_CAPTION else "disabled",
+    "error": None,
+    "load_seconds": None,
+    "warmup_seconds": None,
+}
+
+
+def load_and_warm_caption_model():
+    """Load the caption model, run one warmup generate, then mark captions ready"""
+    global processor, model, device, caption_precision, fast_processor, fast_model
 
-@app.post("/caption")
-async def generate_caption(file: UploadFile = File(...)):
+    try:
+        caption_status["state"] = "loading"
+        started = time.perf_counter()
+        from caption_model import input_size as processor_input_size, load_caption_model
+        processor, model, device, caption_precision = load_caption_model(
+            CAPTION_PRECISION, shared_dir=CAPTION_SHARED_WEIGHTS_DIR
+        )
+        input_size = caption_input_size()
+        if CAPTION_FAST_MODEL:
+            loaded_processor, loaded_model, _, _ = load_caption_model(
+                CAPTION_PRECISION, device=device, shared_dir=CAPTION_SHARED_WEIGHTS_DIR, model_id=CAPTION_FAST_MODEL
+            )
+            # Frames are preprocessed once, before a tier is picked
+            if processor_input_size(loaded_processor) != input_size:
+                raise ValueError(f"{CAPTION_FAST_MODEL} expects {processor_input_size(loaded_processor)} "
+                                 f"images, the main caption model {input_size}")
+            fast_processor, fast_model = loaded_processor, loaded_model
+        caption_status["load_seconds"] = time.perf_counter() - started
+
+        # The first generate pays for lazy kernel and allocator setup
+        caption_status["state"] = "warming"
+        started = time.perf_counter()
+        for tier in caption_tiers():
+            caption_images([to_pixel_values(Image.new("RGB", input_size))], tier=tier)
+        caption_status["warmup_seconds"] = time.perf_counter() - started
+
+        caption_status["state"] = "ready"
+        logger.info(f"Caption model ready (load {caption_status['load_seconds']:.1f}s, "
+                    f"warmup {caption_status['warmup_seconds']:.1f}s)")
+    except Exception as e:
+        caption_status["state"] = "failed"
+        caption_status["error"] = str(e)
+        logger.error(f"Caption model failed to load: {str(e)}")
+
+
+def require_caption_ready():
+    if not SERVES_CAPTION:
+        raise HTTPException(status_code=404, detail=f"Captions are not served by this '{SERVER_ROLE}' worker")
+    if caption_status["state"] != "ready":
+        raise HTTPException(
+            status_code=503,
+            detail=f"Caption model is {caption_status['state']}",
+            headers={"Retry-After": str(CAPTION_RETRY_AFTER_S)}
+        )
+
+# ==========================================
+# PRIORITY ADMISSION
+# ==========================================
+# Request classes, highest priority first
+PRIORITY_CLASSES = ("emergency", "intent", "caption")
+EMERGENCY_MAX_CONCURRENCY = int(os.environ.get("EMERGENCY_MAX_CONCURRENCY", "16"))
+INTENT_MAX_CONCURRENCY = int(os.environ.get("INTENT_MAX_CONCURRENCY", "32"))
+CAPTION_MAX_CONCURRENCY = int(os.environ.get("CAPTION_MAX_CONCURRENCY", "8"))
+# Caption requests allowed to wait (for admission or in the batcher queue)
+# before further ones are rejected with 503 + Retry-After
+CAPTION_QUEUE_SIZE = int(os.environ.get("CAPTION_QUEUE_SIZE", "32"))
+CAPTION_RETRY_AFTER_S = int(os.environ.get("CAPTION_RETRY_AFTER_S", "2"))
+# Longest caption work is held back while emergency requests are running,
+# so a stream of emergencies cannot starve captions completely
+PRIORITY_MAX_HOLD_S = float(os.environ.get("PRIORITY_MAX_HOLD_S", "3"))
+
+
+class AdmissionScheduler:
+    """
+    Per-class concurrency limits with priority for emergency traffic
+
+    Every request is admitted under one class; beyond the class limit it
+    waits in that class's FIFO queue. While any emergency request is running
+    or waiting, caption work is held: new caption requests queue and the
+    caption batcher does not start another batch, which keeps the CPU free
+    for the emergency path. Intents are not held, they mostly wait on Groq.
+
+    A class with a max_waiting entry rejects new requests with 503 once that
+    many are already waiting, so a caption flood is shed instead of queueing
+    without bound. Emergencies and intents are never rejected here.
+    """
+
+    def __init__(self, limits=None, max_hold_s=PRIORITY_MAX_HOLD_S, max_waiting=None):
+        self.limits = limits or {
+            "emergency": EMERGENCY_MAX_CONCURRENCY,
+            "intent": INTENT_MAX_CONCURRENCY,
+            "caption": CAPTION_MAX_CONCURRENCY,
+        }
+        self.max_waiting = max_waiting if max_waiting is not None else {"caption": CAPTION_QUEUE_SIZE}
+        self.rejected = {name: 0 for name in PRIORITY_CLASSES}
+        self.max_hold_s = max_hold_s
+        self.running = {name: 0 for name in PRIORITY_CLASSES}
+        self.waiters = {name: deque() for name in PRIORITY_CLASSES}
+        self.unheld_waiters = []
+        self.hold_started = None
+        self.hold_timer = None
+        self.holds = 0
+        self.admitted = {name: 0 for name in PRIORITY_CLASSES}
+        self.queued = {name: 0 for name in PRIORITY_CLASSES}
+        self.total_queue_time = {name: 0.0 for name in PRIORITY_CLASSES}
+        self.max_queue_time = {name: 0.0 for name in PRIORITY_CLASSES}
+
+    def _emergency_active(self):
+        return self.running["emergency"] > 0 or len(self.waiters["emergency"]) > 0
+
+    def _update_hold(self, loop):
+        if self._emergency_active():
+            if self.hold_started is None:
+                self.holds += 1
+                self.hold_started = loop.time()
+                # Re-dispatch when the hold expires even if nothing else changes
+                self.hold_timer = loop.call_later(self.max_hold_s, self._dispatch)
+        elif self.hold_started is not None:
+            self.hold_started = None
+            self.hold_timer.cancel()
+            self.hold_timer = None
+
+    def held(self, name) -> bool:
+        """True while this class has to yield to emergency requests"""
+        if name != "caption" or self.hold_started is None:
+            return False
+        return asyncio.get_running_loop().time() - self.hold_started < self.max_hold_s
+
+    def _can_start(self, name):
+        return self.running[name] < self.limits[name] and not self.held(name)
+
+    def _dispatch(self):
+        self._update_hold(asyncio.get_running_loop())
+        for name in PRIORITY_CLASSES:
+            queue = self.waiters[name]
+            while queue and self._can_start(name):
+                future = queue.popleft()
+                if future.done():
+                    continue  # the waiting request was cancelled
+                self.running[name] += 1
+                future.set_result(None)
+
+        if not self.held("caption"):
+            for future in self.unheld_waiters:
+                if not future.done():
+                    future.set_result(None)
+            self.unheld_waiters = []
+
+    def waiting(self, name) -> int:
+        # Cancelled waiters stay in the deque until the next dispatch
+        return sum(not future.done() for future in self.waiters[name])
+
+    async def acquire(self, name):
+        """Wait for a slot in the given class; pair with release()"""
+        loop = asyncio.get_running_loop()
+        queued_at = loop.time()
+
+        if not self.waiters[name] and self._can_start(name):
+            self.running[name] += 1
+            self._update_hold(loop)
+        else:
+            max_waiting = self.max_waiting.get(name)
+            if max_waiting is not None and self.waiting(name) >= max_waiting:
+                self.rejected[name] += 1
+                logger.warning(f"Admission queue for {name} full ({max_waiting}), rejecting request")
+                raise HTTPException(
+                    status_code=503,
+                    detail="Server is busy. Please try again shortly.",
+                    headers={"Retry-After": str(CAPTION_RETRY_AFTER_S)}
+                )
+            future = loop.create_future()
+            self.waiters[name].append(future)
+            self.queued[name] += 1
+            self._update_hold(loop)
+            try:
+                await future
+            except asyncio.CancelledError:
+                if future.done() and not future.cancelled():
+                    # Granted just as the request went away
+                    self.release(name)
+                raise
+
+        waited = loop.time() - queued_at
+        admission_queue_seconds.observe(waited, priority=name)
+        self.admitted[name] += 1
+        self.total_queue_time[name] += waited
+        self.max_queue_time[name] = max(self.max_queue_time[name], waited)
+
+    def release(self, name):
+        self.running[name] -= 1
+        self._dispatch()
+
+    @asynccontextmanager
+    async def admit(self, name):
+        await self.acquire(name)
+        try:
+            yield
+        finally:
+            self.release(name)
+
+    async def wait_until_unheld(self, name):
+        """Return once work of this class may use the CPU again"""
+        if not self.held(name):
+            return
+        future = asyncio.get_running_loop().create_future()
+        self.unheld_waiters.append(future)
+        await future
+
+    def stats(self):
+        classes = {}
+        for name in PRIORITY_CLASSES:
+            admitted = self.admitted[name]
+            classes[name] = {
+                "limit": self.limits[name],
+                "running": self.running[name],
+                "waiting": self.waiting(name),
+                "max_waiting": self.max_waiting.get(name),
+                "rejected": self.rejected[name],
+                "admitted": admitted,
+                "queued": self.queued[name],
+                "avg_queue_ms": (self.total_queue_time[name] / admitted * 1000) if admitted else 0.0,
+                "max_queue_ms": self.max_queue_time[name] * 1000,
+            }
+        return {
+            "classes": classes,
+            "caption_held": self.hold_started is not None,
+            "holds": self.holds,
+            "max_hold_s": self.max_hold_s,
+        }
+
+
+admission = AdmissionScheduler()
+
+# ==========================================
+# CAPTION MICRO-BATCHING
+# ==========================================
+CAPTION_MAX_LENGTH = 30
+CAPTION_MAX_BATCH_SIZE = int(os.environ.get("CAPTION_MAX_BATCH_SIZE", "8"))
+CAPTION_MAX_WAIT_MS = float(os.environ.get("CAPTION_MAX_WAIT_MS", "25"))
+# With a fast tier loaded, batches go to it while at least this many
+# requests are queued or running
+CAPTION_FAST_TIER_QUEUE_DEPTH = int(os.environ.get("CAPTION_FAST_TIER_QUEUE_DEPTH", str(CAPTION_MAX_BATCH_SIZE)))
+
+# All model work runs on this single thread so the event loop stays free for
+# intent requests, and batches never compete with each other for the CPU.
+inference_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="caption-inference")
+
+
+class StageTimings:
+    """Running count, mean and max duration of each named processing stage"""
+
+    def __init__(self, histogram=None):
+        self.lock = threading.Lock()
+        self.stages = {}  # stage -> [count, total_seconds, max_seconds]
+        self.histogram = histogram
+
+    def record(self, stage, seconds):
+        if self.histogram is not None:
+            self.histogram.observe(seconds, stage=stage)
+        with self.lock:
+            entry = self.stages.setdefault(stage, [0, 0.0, 0.0])
+            entry[0] += 1
+            entry[1] += seconds
+            entry[2] = max(entry[2], seconds)
+
+    def stats(self):
+        with self.lock:
+            return {
+                stage: {"count": count, "avg_ms": total / count * 1000, "max_ms": longest * 1000}
+                for stage, (count, total, longest) in self.stages.items()
+            }
+
+
+caption_timings = StageTimings(caption_stage_seconds)
+
+
+def caption_input_size():
+    from caption_model import input_size
+    return input_size(processor)
+
+
+def decode_image(contents: bytes, size):
+    """
+    Decode image bytes to an RGB PIL image of exactly `size` (width, height)
+
+    JPEGs are decoded in draft mode: libjpeg scales by 1/2, 1/4 or 1/8 during
+    the DCT, so a full sensor-resolution frame is never materialized and only
+    a small image is left to resize.
+    """
+    image = Image.open(io.BytesIO(contents))
+    if image.format == "JPEG":
+        image.draft("RGB", size)
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    if image.size != size:
+        image = image.resize(size, Image.BICUBIC)
+    return image
+
+
+def to_pixel_values(image):
+    from caption_model import pixel_values_from_image
+    return pixel_values_from_image(image, processor)
+
+
+def caption_tiers():
+    return ["large", "fast"] if fast_model is not None else ["large"]
+
+
+def tier_components(tier):
+    """(processor, model) serving a tier"""
+    return (fast_processor, fast_model) if tier == "fast" else (processor, model)
+
+
+def caption_images(pixel_values, streamer=None, cancel_event=None, tier="large"):
+    """Run one batched BLIP pass over preprocessed images and return one caption per image"""
+    from caption_model import generate_ids
+    tier_processor, tier_model = tier_components(tier)
+    started = time.perf_counter()
+    token_ids = generate_ids(tier_model, device, pixel_values, max_length=CAPTION_MAX_LENGTH,
+                             streamer=streamer, cancel_event=cancel_event)
+    generated = time.perf_counter()
+    captions = tier_processor.batch_decode(token_ids, skip_special_tokens=True)
+    caption_timings.record("generate_batch", generated - started)
+    caption_timings.record("token_decode", time.perf_counter() - generated)
+    return captions
+
+
+class CaptionBatcher:
+    """
+    Collects concurrent caption requests into a single batched generate call
+
+    A request waits at most max_wait_ms for other requests to join its batch;
+    a batch is flushed early as soon as it reaches max_batch_size. Batches run
+    on the inference executor. At most queue_size requests may be waiting;
+    further requests are rejected with 503 instead of piling up.
+
+    With a fast tier loaded, each request in a batch is served by the large
+    model unless fast_tier_depth requests are queued or running, or the
+    large model's recent batch time would overrun its latency budget; those
+    go to the fast model, in a batch run ahead of the large one.
+    """
+
+    def __init__(self, max_batch_size=CAPTION_MAX_BATCH_SIZE, max_wait_ms=CAPTION_MAX_WAIT_MS,
+                 queue_size=CAPTION_QUEUE_SIZE, executor=inference_executor,
+                 fast_tier_depth=CAPTION_FAST_TIER_QUEUE_DEPTH):
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+        self.queue_size = max(1, queue_size)
+        self.executor = executor
+        self.fast_tier_depth = max(1, fast_tier_depth)
+        # Exponentially weighted batch run time per tier, for latency budgets
+        self.batch_seconds = {}
+        self.served = {}
+        self.queue = None
+        self.worker = None
+        self.in_flight = 0
+        self.batches_run = 0
+        self.images_captioned = 0
+        self.rejected = 0
+        self.waits_recorded = 0
+        self.total_wait = 0.0
+        self.max_wait_seen = 0.0
+        self.last_wait = 0.0
+
+    def _ensure_worker(self):
+        # The queue and worker task must belong to the running event loop
+        loop = asyncio.get_running_loop()
+        if self.worker is None or self.worker.done() or self.worker.get_loop() is not loop:
+            self.queue = asyncio.Queue(maxsize=self.queue_size)
+            self.worker = loop.create_task(self._run())
+
+    def depth(self) -> int:
+        """Requests waiting in the queue plus those in the running batch"""
+        return (self.queue.qsize() if self.queue else 0) + self.in_flight
+
+    def backlog(self) -> int:
+        """depth() plus caption requests still waiting for admission"""
+        return self.depth() + admission.waiting("caption")
+
+    async def submit(self, pixel_values, latency_budget_s=None):
+        """
+        Queue a preprocessed image for captioning and wait for its caption
+
+        Returns:
+            tuple: (caption, tier) where tier names the model that served it
+        """
+        self._ensure_worker()
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        try:
+            self.queue.put_nowait((pixel_values, future, loop.time(), latency_budget_s))
+        except asyncio.QueueFull:
+            self._reject()
+
+        return await future
+
+    def choose_tier(self, backlog, waited=0.0, latency_budget_s=None):
+        """Tier for a request with `backlog` requests queued or running, after waiting `waited` seconds"""
+        if fast_model is None:
+            return "large"
+        if backlog >= self.fast_tier_depth:
+            return "fast"
+        expected = self.batch_seconds.get("large")
+        if latency_budget_s is not None and expected is not None and waited + expected > latency_budget_s:
+            return "fast"
+        return "large"
+
+    def _record_tier(self, tier, count, seconds):
+        previous = self.batch_seconds.get(tier)
+        self.batch_seconds[tier] = seconds if previous is None else 0.8 * previous + 0.2 * seconds
+        self.served[tier] = self.served.get(tier, 0) + count
+        caption_tier_total.inc(count, tier=tier)
+
+    def start_exclusive(self, func, *args):
+        """
+        Start a job that cannot join a batch (e.g. a streamed caption) on the
+        inference executor, subject to the same admission limit as submit
+
+        Returns:
+            asyncio.Future: resolves to the job's return value
+        """
+        if self.depth() >= self.queue_size:
+            self._reject()
+
+        self.in_flight += 1
+        future = asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+        future.add_done_callback(self._exclusive_done)
+        return future
+
+    def _exclusive_done(self, future):
+        self.in_flight -= 1
+
+    def _reject(self):
+        self.rejected += 1
+        logger.warning(f"Caption queue full ({self.queue_size}), rejecting request")
+        raise HTTPException(
+            status_code=503,
+            detail="Caption server is busy. Please try again shortly.",
+            headers={"Retry-After": str(CAPTION_RETRY_AFTER_S)}
+        )
+
+    async def _collect_batch(self):
+        batch = [await self.queue.get()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.max_wait
+
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+
+        # Requests whose client went away do not need a caption
+        return [item for item in batch if not item[1].done()]
+
+    def _record_wait(self, batch, started):
+        for _, _, enqueued, _ in batch:
+            wait = started - enqueued
+            self.waits_recorded += 1
+            self.total_wait += wait
+            self.max_wait_seen = max(self.max_wait_seen, wait)
+            self.last_wait = wait
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect_batch()
+            if not batch:
+                continue
+
+            # Emergency requests get the CPU first
+            await admission.wait_until_unheld("caption")
+            batch = [item for item in batch if not item[1].done()]
+            if not batch:
+                continue
+
+            now = loop.time()
+            self._record_wait(batch, now)
+            backlog = self.backlog() + len(batch)
+            groups = {}
+            for item in batch:
+                tier = self.choose_tier(backlog, now - item[2], item[3])
+                groups.setdefault(tier, []).append(item)
+
+            self.in_flight += len(batch)
+            try:
+                # The fast tier serves the requests in a hurry, so it goes first
+                for tier in ("fast", "large"):
+                    if tier in groups:
+                        await self._run_group(loop, tier, groups.pop(tier))
+            finally:
+                self.in_flight -= len(batch)
+
+    async def _run_group(self, loop, tier, group):
+        # Stop generating once every request in the group has gone away
+        # (client disconnected, or a speculative /assist caption cancelled)
+        cancel_event = threading.Event()
+        futures = [future for _, future, _, _ in group]
+        for future in futures:
+            future.add_done_callback(
+                lambda _: all(f.cancelled() for f in futures) and cancel_event.set()
+            )
+        started = time.perf_counter()
+        try:
+            captions = await loop.run_in_executor(
+                self.executor, caption_images, [pixels for pixels, _, _, _ in group], None, cancel_event, tier
+            )
+        except Exception as e:
+            logger.error(f"Caption batch of {len(group)} on the {tier} tier failed: {str(e)}")
+            for future in futures:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        if not cancel_event.is_set():
+            self._record_tier(tier, len(group), time.perf_counter() - started)
+        self.batches_run += 1
+        self.images_captioned += len(group)
+        for future, caption in zip(futures, captions):
+            if not future.done():
+                future.set_result((caption, tier))
+
+    def stats(self):
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "queue_size": self.queue_size,
+            "queue_depth": self.depth(),
+            "backlog": self.backlog(),
+            "batches_run": self.batches_run,
+            "images_captioned": self.images_captioned,
+            "avg_batch_size": (self.images_captioned / self.batches_run) if self.batches_run else 0.0,
+            "rejected": self.rejected,
+            "avg_queue_wait_ms": (self.total_wait / self.waits_recorded * 1000) if self.waits_recorded else 0.0,
+            "max_queue_wait_ms": self.max_wait_seen * 1000,
+            "last_queue_wait_ms": self.last_wait * 1000,
+            "tiers": caption_tiers(),
+            "fast_tier_queue_depth": self.fast_tier_depth,
+            "served_by_tier": dict(self.served),
+            "avg_batch_ms_by_tier": {tier: seconds * 1000 for tier, seconds in self.batch_seconds.items()},
+        }
+
+
+caption_batcher = CaptionBatcher()
+
+# ==========================================
+# PERCEPTUAL-HASH CAPTION CACHE
+# ==========================================
+CAPTION_CACHE_SIZE = int(os.environ.get("CAPTION_CACHE_SIZE", "256"))
+CAPTION_CACHE_TTL_S = float(os.environ.get("CAPTION_CACHE_TTL_S", "30"))
+CAPTION_CACHE_MAX_DISTANCE = int(os.environ.get("CAPTION_CACHE_MAX_DISTANCE", "6"))
+
+
+def dhash(image, hash_size=8) -> int:
+    """64-bit difference hash: compares horizontally adjacent pixels of a tiny grayscale copy"""
+    small = image.convert("L").resize((hash_size + 1, hash_size), Image.BILINEAR)
+    pixels = list(small.getdata())
+
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+def mean_color(image, levels=4) -> int:
+    """Average RGB of the image, each channel quantized to `levels` steps, packed into one int"""
+    red, green, blue = image.convert("RGB").resize((1, 1), Image.BOX).getpixel((0, 0))
+    step = 256 // levels
+    return ((red // step) * levels + green // step) * levels + blue // step
+
+
+def image_hash_of(image) -> int:
+    """
+    dHash in the low 64 bits, coarse mean color above them
+
+    dHash only sees gradients, so uniform or dark frames hash to 0 whatever
+    their color; the color bits keep a red wall from matching a green one.
+    """
+    return (mean_color(image) << 64) | dhash(image)
+
+
+def hash_distance(a, b):
+    """Hamming distance between the dHash bits of two image hashes; infinite if their colors differ"""
+    if a >> 64 != b >> 64:
+        return math.inf
+    return (a ^ b).bit_count()
+
+
+class CaptionCache:
+    """
+    LRU cache of captions keyed on perceptual image hashes
+
+    A lookup hits when a stored hash has the same coarse color and is within
+    max_distance bits (Hamming distance) of the query hash, so near-identical frames from a user who is
+    standing still share one caption. Entries expire after ttl seconds.
+    """
+
+    def __init__(self, max_size=CAPTION_CACHE_SIZE, ttl=CAPTION_CACHE_TTL_S,
+                 max_distance=CAPTION_CACHE_MAX_DISTANCE):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.max_distance = max_distance
+        self.entries = OrderedDict()  # hash -> (caption, stored_at)
+        self.hits = 0
+        self.misses = 0
+
+    def _evict_expired(self, now):
+        expired = [key for key, (_, stored_at) in self.entries.items() if now - stored_at > self.ttl]
+        for key in expired:
+            del self.entries[key]
+
+    def get(self, image_hash):
+        if self.max_size <= 0:
+            return None
+
+        now = time.monotonic()
+        self._evict_expired(now)
+
+        best_key, best_distance = None, self.max_distance + 1
+        for key in self.entries:
+            distance = hash_distance(key, image_hash)
+            if distance < best_distance:
+                best_key, best_distance = key, distance
+                if distance == 0:
+                    break
+
+        if best_key is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self.entries.move_to_end(best_key)
+        return self.entries[best_key][0]
+
+    def put(self, image_hash, caption):
+        if self.max_size <= 0:
+            return
+
+        self.entries[image_hash] = (caption, time.monotonic())
+        self.entries.move_to_end(image_hash)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self.entries),
+            "max_size": self.max_size,
+            "ttl_s": self.ttl,
+            "max_distance": self.max_distance,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits / lookups) if lookups else 0.0,
+        }
+
+
+caption_cache = CaptionCache()
+
+
+def prepare_image(contents: bytes):
+    """
+    Turn uploaded bytes into model input, timing each stage
+
+    Returns:
+        tuple: (pixel_values, image_hash)
+    """
+    started = time.perf_counter()
+    image = decode_image(contents, caption_input_size())
+    decoded = time.perf_counter()
+    image_hash = image_hash_of(image)
+    hashed = time.perf_counter()
+    pixel_values = to_pixel_values(image)
+    done = time.perf_counter()
+
+    caption_timings.record("decode_resize", decoded - started)
+    caption_timings.record("hash", hashed - decoded)
+    caption_timings.record("to_tensor", done - hashed)
+    return pixel_values, image_hash
+
+
+async def cached_caption(pixel_values, image_hash, latency_budget_s=None):
+    """
+    Caption from the perceptual-hash cache, or from the batcher on a miss
+
+    Returns:
+        tuple: (caption, tier), tier "cache" for a cache hit
+    """
+    caption = caption_cache.get(image_hash)
+    if caption is not None:
+        return caption, "cache"
+    caption, tier = await caption_batcher.submit(pixel_values, latency_budget_s)
+    caption_cache.put(image_hash, caption)
+    return caption, tier
+
+
+async def cached_captions(prepared, latency_budget_s=None):
+    """(caption, tier) for several (pixel_values, image_hash) pairs; misses share batches in the batcher"""
+    tasks = [asyncio.ensure_future(cached_caption(pixel_values, image_hash, latency_budget_s))
+             for pixel_values, image_hash in prepared]
+    try:
+        return await asyncio.gather(*tasks)
+    finally:
+        # One frame rejected (queue full) or the client gone: drop the rest
+        for task in tasks:
+            task.cancel()
+
+
+async def read_upload(file: UploadFile) -> bytes:
+    started = time.perf_counter()
     contents = await file.read()
-    image = Image.open(io.BytesIO(contents)).convert("RGB")
+    caption_timings.record("read", time.perf_counter() - started)
+    return contents
+
+
+# Most frames /caption accepts in one batch request
+CAPTION_MAX_IMAGES_PER_REQUEST = int(os.environ.get("CAPTION_MAX_IMAGES_PER_REQUEST", str(CAPTION_MAX_BATCH_SIZE)))
+RAW_IMAGE_CONTENT_TYPES = ("image/", "application/octet-stream")
+
+
+async def read_raw_image(request: Request) -> bytes:
+    content_type = request.headers.get("content-type", "").lower()
+    if not content_type.startswith(RAW_IMAGE_CONTENT_TYPES):
+        raise HTTPException(
+            status_code=415,
+            detail="Send the image as multipart field 'file' (or 'files'), or as an image/* or "
+                   "application/octet-stream body"
+        )
+    started = time.perf_counter()
+    contents = await request.body()
+    caption_timings.record("read", time.perf_counter() - started)
+    if not contents:
+        raise HTTPException(status_code=400, detail="Empty image body")
+    return contents
+
+
+def caption_input_headers():
+    width, height = caption_input_size()
+    return {"X-Caption-Input-Size": f"{width}x{height}"}
+
 
-    inputs = processor(images=image, return_tensors="pt").to(device)
+@app.get("/caption/config")
+def caption_config():
+    """Upload hints for clients: frames larger than input_size are only downscaled here"""
+    require_caption_ready()
+    width, height = caption_input_size()
+    return {
+        "input_size": {"width": width, "height": height},
+        "raw_content_types": ["image/jpeg", "image/png", "application/octet-stream"],
+        "max_images_per_request": CAPTION_MAX_IMAGES_PER_REQUEST,
+        "tiers": caption_tiers(),
+    }
+
+
+@app.post("/caption")
+async def generate_caption(
+    request: Request,
+    file: Optional[UploadFile] = File(None),
+    files: Optional[List[UploadFile]] = File(None),
+    latency_budget_ms: Optional[float] = None,
+):
+    """
+    Caption one frame, or several in one request
 
-    out = model.generate(**inputs, max_length=30)
-    caption = processor.decode(out[0], skip_special_tokens=True)
+    The frame is sent as multipart field "file", or as the raw request body
+    with an image/* or application/octet-stream content type (no multipart
+    encoding or parsing). Several frames go in repeated multipart "files"
+    fields and get {"captions": [...]} back, in upload order. Responses carry
+    X-Caption-Input-Size, the resolution frames are downscaled to anyway.
+
+    "tier" ("tiers" for several frames) names the model that answered:
+    "large", "fast" or "cache". latency_budget_ms lets a request prefer the
+    fast tier when the large model is not expected to finish in time.
+    """
+    require_caption_ready()
+    if files and len(files) > CAPTION_MAX_IMAGES_PER_REQUEST:
+        raise HTTPException(
+            status_code=413,
+            detail=f"At most {CAPTION_MAX_IMAGES_PER_REQUEST} images per request, got {len(files)}"
+        )
+
+    latency_budget_s = latency_budget_ms / 1000 if latency_budget_ms is not None else None
+
+    async with admission.admit("caption"):
+        if files:
+            contents = [await read_upload(upload) for upload in files]
+            prepared = await run_in_threadpool(lambda: [prepare_image(frame) for frame in contents])
+            results = await cached_captions(prepared, latency_budget_s)
+            return JSONResponse(
+                content={"captions": [caption for caption, _ in results], "tiers": [tier for _, tier in results]},
+                headers=caption_input_headers()
+            )
+
+        contents = await read_upload(file) if file is not None else await read_raw_image(request)
+        pixel_values, image_hash = await run_in_threadpool(prepare_image, contents)
+
+        caption, tier = await cached_caption(pixel_values, image_hash, latency_budget_s)
+
+    return JSONResponse(content={"caption": caption, "tier": tier}, headers=caption_input_headers())
+
+
+def sse_event(event, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+STREAM_DISCONNECT_POLL_S = 0.1
+
+
+async def cancel_on_disconnect(request: Request, job, cancel_event):
+    """Set cancel_event if the client goes away before job finishes, streamed or not"""
+    while not job.done():
+        if await request.is_disconnected():
+            cancel_event.set()
+            return
+        await asyncio.sleep(STREAM_DISCONNECT_POLL_S)
+
+
+@app.post("/caption/stream")
+async def stream_caption(request: Request, file: UploadFile = File(...)):
+    """
+    Server-Sent Events variant of /caption
+
+    Emits "token" events with newly decoded text while generation runs, then
+    a final "done" event carrying the usual {"caption": ...} payload. Errors
+    after the stream has started are reported as an "error" event.
+    """
+    require_caption_ready()
+    await admission.acquire("caption")
+    try:
+        contents = await read_upload(file)
+        pixel_values, image_hash = await run_in_threadpool(prepare_image, contents)
+    except BaseException:
+        admission.release("caption")
+        raise
+
+    cached = caption_cache.get(image_hash)
+    if cached is not None:
+        admission.release("caption")
+
+        async def cached_events():
+            yield sse_event("token", {"text": cached})
+            yield sse_event("done", {"caption": cached, "tier": "cache"})
+        return StreamingResponse(cached_events(), media_type="text/event-stream")
+
+    from caption_model import AsyncCaptionStreamer
+    loop = asyncio.get_running_loop()
+    chunks = asyncio.Queue()
+    tier = caption_batcher.choose_tier(caption_batcher.backlog() + 1)
+    streamer = AsyncCaptionStreamer(tier_components(tier)[0].tokenizer, loop, chunks)
+    cancel_event = threading.Event()
+
+    # Admission happens before the response starts, so a busy server still
+    # answers with a plain 503. The admission slot is held until generate ends.
+    try:
+        job = caption_batcher.start_exclusive(caption_images, [pixel_values], streamer, cancel_event, tier)
+    except BaseException:
+        admission.release("caption")
+        raise
+    job.add_done_callback(lambda _: admission.release("caption"))
+    # Unblocks the event loop below if generate fails before streaming ends
+    job.add_done_callback(lambda _: chunks.put_nowait(("", True)))
+    # The response body may never start (client gone before the first
+    # event), in which case events() below never runs its finally
+    watcher = asyncio.ensure_future(cancel_on_disconnect(request, job, cancel_event))
+    job.add_done_callback(lambda _: watcher.cancel())
+
+    async def events():
+        try:
+            finished = False
+            while not finished:
+                text, finished = await chunks.get()
+                if text:
+                    yield sse_event("token", {"text": text})
+
+            caption = (await job)[0]
+            caption_cache.put(image_hash, caption)
+            caption_tier_total.inc(tier=tier)
+            yield sse_event("done", {"caption": caption, "tier": tier})
+        except Exception as e:
+            logger.error(f"Streamed caption failed: {str(e)}")
+            yield sse_event("error", {"detail": str(e)})
+        finally:
+            # Stops generate early if the client disconnected mid-stream
+            cancel_event.set()
+
+    return StreamingResponse(events(), media_type="text/event-stream")
 
-    return {"caption": caption}
+
+# ==========================================
+# VISION EMBEDDING CACHE & VISUAL QUERIES
+# ==========================================
+VISION_CACHE_SIZE = int(os.environ.get("VISION_CACHE_SIZE", "16"))
+VISUAL_QUERY_MAX_PROMPTS = int(os.environ.get("VISUAL_QUERY_MAX_PROMPTS", "8"))
+
+
+class VisionEmbeddingCache:
+    """
+    LRU cache of BLIP vision-encoder outputs keyed by a hash of the image bytes
+
+    Only touched from the inference thread, so it needs no locking. Each
+    entry of blip-large is a few MB, so keep max_size small.
+    """
+
+    def __init__(self, max_size=VISION_CACHE_SIZE):
+        self.max_size = max_size
+        self.entries = OrderedDict()  # content hash -> image embeddings
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_encode(self, key, pixel_values):
+        embeds = self.entries.get(key)
+        if embeds is not None:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return embeds
+
+        self.misses += 1
+        from caption_model import encode_images
+        started = time.perf_counter()
+        embeds = encode_images(model, device, [pixel_values])
+        caption_timings.record("vision_encode", time.perf_counter() - started)
+
+        if self.max_size > 0:
+            self.entries[key] = embeds
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+        return embeds
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self.entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits / lookups) if lookups else 0.0,
+        }
+
+
+vision_cache = VisionEmbeddingCache()
+
+
+def answer_prompts(content_key, pixel_values, prompts):
+    """Encode the image once (or reuse cached embeddings), then decode each prompt"""
+    from caption_model import generate_from_embeds
+    embeds = vision_cache.get_or_encode(content_key, pixel_values)
+
+    answers = []
+    for prompt in prompts:
+        started = time.perf_counter()
+        caption = generate_from_embeds(processor, model, embeds, prompt, max_length=CAPTION_MAX_LENGTH)
+        caption_timings.record("text_decode", time.perf_counter() - started)
+        answers.append({"prompt": prompt, "caption": caption})
+    return answers
+
+
+@app.post("/visual_query")
+async def visual_query(file: UploadFile = File(...), prompts: List[str] = Form(default=[""])):
+    """
+    Answer several text prompts about one image
+
+    Each prompt is sent as a repeated "prompts" form field. An empty prompt
+    asks for an unconditional caption; otherwise BLIP continues the prompt,
+    e.g. "a sign that says". The vision encoder runs once per distinct image
+    (its output is cached by content hash) and only the text decoder runs
+    per prompt.
+    """
+    require_caption_ready()
+    if len(prompts) > VISUAL_QUERY_MAX_PROMPTS:
+        raise HTTPException(status_code=400, detail=f"At most {VISUAL_QUERY_MAX_PROMPTS} prompts per request")
+
+    async with admission.admit("caption"):
+        contents = await read_upload(file)
+        content_key = hashlib.blake2b(contents, digest_size=16).hexdigest()
+        pixel_values, _ = await run_in_threadpool(prepare_image, contents)
+
+        await admission.wait_until_unheld("caption")
+        answers = await caption_batcher.start_exclusive(answer_prompts, content_key, pixel_values, prompts)
+    return {"answers": answers}
+
+
+# ==========================================
+# CONTINUOUS SCENE NARRATION
+# ==========================================
+# Minimum dHash distance from the last narrated frame for a new caption
+SCENE_CHANGE_DISTANCE = int(os.environ.get("SCENE_CHANGE_DISTANCE", "10"))
+
+
+@app.websocket("/ws/scene")
+async def scene_stream(websocket: WebSocket):
+    """
+    Continuous scene narration over a WebSocket
+
+    The client sends frames as binary messages. Only the newest unprocessed
+    frame is kept, so a slow server skips stale frames instead of falling
+    behind. A {"caption": ...} message is sent only when the scene has changed
+    meaningfully: the frame's perceptual hash must differ from the last
+    narrated frame by more than SCENE_CHANGE_DISTANCE bits, and the caption
+    must differ from the last one sent.
+    """
+    await websocket.accept()
+    if not SERVES_CAPTION:
+        await websocket.close(code=1008, reason=f"Captions are not served by this '{SERVER_ROLE}' worker")
+        return
+
+    latest = {"frame": None, "dropped": 0}
+    frame_ready = asyncio.Event()
+
+    async def receive_frames():
+        while True:
+            frame = await websocket.receive_bytes()
+            if latest["frame"] is not None:
+                latest["dropped"] += 1
+            latest["frame"] = frame
+            frame_ready.set()
+
+    async def narrate():
+        last_hash = None
+        last_caption = None
+        while True:
+            await frame_ready.wait()
+            frame_ready.clear()
+            frame, latest["frame"] = latest["frame"], None
+
+            if caption_status["state"] != "ready":
+                await websocket.send_json({"error": f"Caption model is {caption_status['state']}"})
+                continue
+
+            try:
+                await admission.acquire("caption")
+            except HTTPException as e:
+                await websocket.send_json({"error": e.detail})
+                continue
+            try:
+                try:
+                    pixel_values, image_hash = await run_in_threadpool(prepare_image, frame)
+                except Exception as e:
+                    await websocket.send_json({"error": f"Could not decode frame: {str(e)}"})
+                    continue
+
+                if last_hash is not None and hash_distance(image_hash, last_hash) <= SCENE_CHANGE_DISTANCE:
+                    continue
+
+                try:
+                    caption, tier = await cached_caption(pixel_values, image_hash)
+                except HTTPException as e:
+                    await websocket.send_json({"error": e.detail})
+                    continue
+            finally:
+                admission.release("caption")
+
+            last_hash = image_hash
+            if caption != last_caption:
+                last_caption = caption
+                await websocket.send_json({"caption": caption, "tier": tier, "dropped_frames": latest["dropped"]})
+
+    tasks = [asyncio.ensure_future(receive_frames()), asyncio.ensure_future(narrate())]
+    try:
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            error = task.exception()
+            if error is not None and not isinstance(error, WebSocketDisconnect):
+                logger.error(f"Scene stream failed: {str(error)}")
+    finally:
+        for task in tasks:
+            task.cancel()
 
 # ==========================================
 # GROQ API KEY ROTATION MANAGER
 # ==========================================
+GROQ_CONNECT_TIMEOUT_S = float(os.environ.get("GROQ_CONNECT_TIMEOUT_S", "3"))
+GROQ_READ_TIMEOUT_S = float(os.environ.get("GROQ_READ_TIMEOUT_S", "10"))
+# How long a key sits out after a 429 that carries no reset information
+GROQ_KEY_COOLDOWN_S = float(os.environ.get("GROQ_KEY_COOLDOWN_S", "10"))
+# SQLite file shared by every worker on this machine for key budgets, parking
+# and in-flight counts; unset keeps key state private to each process
+GROQ_KEY_STATE_PATH = os.environ.get("GROQ_KEY_STATE_PATH", "")
+# Longest the event loop waits on a locked key state file before skipping it
+GROQ_KEY_STATE_TIMEOUT_MS = float(os.environ.get("GROQ_KEY_STATE_TIMEOUT_MS", "20"))
+
+# Per-request deadlines for intent resolution; emergency-looking transcripts
+# get a tighter one and are hedged earlier
+INTENT_DEADLINE_S = float(os.environ.get("INTENT_DEADLINE_S", "6"))
+INTENT_EMERGENCY_DEADLINE_S = float(os.environ.get("INTENT_EMERGENCY_DEADLINE_S", "2.5"))
+# A duplicate request goes to a second key once the first has taken longer
+# than this percentile of recent Groq latencies
+INTENT_HEDGE_PERCENTILE = float(os.environ.get("INTENT_HEDGE_PERCENTILE", "95"))
+INTENT_EMERGENCY_HEDGE_PERCENTILE = float(os.environ.get("INTENT_EMERGENCY_HEDGE_PERCENTILE", "50"))
+# Hedge delay used until enough latencies have been observed
+INTENT_HEDGE_DEFAULT_MS = float(os.environ.get("INTENT_HEDGE_DEFAULT_MS", "1500"))
+
+DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+
+
+def parse_reset_duration(value):
+    """Parse Groq reset durations such as "7.66s", "2m59.56s" or "120ms" into seconds"""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = DURATION_PART.findall(value)
+    if not parts:
+        return None
+    scale = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+    return sum(float(amount) * scale[unit] for amount, unit in parts)
+
+
+class LatencyTracker:
+    """Rolling window of successful call latencies for choosing hedge delays"""
+
+    def __init__(self, window=200, min_samples=20):
+        self.samples = deque(maxlen=window)
+        self.min_samples = min_samples
+
+    def record(self, seconds):
+        self.samples.append(seconds)
+
+    def percentile(self, percent):
+        """Latency at the given percentile in seconds, or None with too little history"""
+        if len(self.samples) < self.min_samples:
+            return None
+        ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, max(0, math.ceil(percent / 100 * len(ordered)) - 1))
+        return ordered[index]
+
+    def stats(self):
+        return {
+            "samples": len(self.samples),
+            "p50_ms": round(self.percentile(50) * 1000, 1) if self.percentile(50) is not None else None,
+            "p95_ms": round(self.percentile(95) * 1000, 1) if self.percentile(95) is not None else None,
+        }
+
+
+class KeyState:
+    """Rate-limit budget and load of one API key, as last reported by Groq"""
+
+    def __init__(self, index):
+        self.index = index
+        self.in_flight = 0
+        # Calls on this key in flight in other workers (shared key state only)
+        self.other_in_flight = 0
+        self.remaining_requests = None
+        self.remaining_tokens = None
+        self.requests_reset_at = 0.0
+        self.tokens_reset_at = 0.0
+        self.parked_until = 0.0
+        self.requests = 0
+        self.rate_limited = 0
+
+    def available(self, now) -> bool:
+        if now < self.parked_until:
+            return False
+        if self.remaining_requests is not None and now < self.requests_reset_at \
+                and self.remaining_requests <= self.total_in_flight():
+            return False
+        if self.remaining_tokens is not None and now < self.tokens_reset_at and self.remaining_tokens <= 0:
+            return False
+        return True
+
+    def available_at(self, now) -> float:
+        """Earliest time this key can take a request again"""
+        if self.available(now):
+            return now
+        candidates = [self.parked_until]
+        if self.remaining_requests is not None and self.remaining_requests <= self.total_in_flight():
+            candidates.append(self.requests_reset_at)
+        if self.remaining_tokens is not None and self.remaining_tokens <= 0:
+            candidates.append(self.tokens_reset_at)
+        return max(now, max(candidates))
+
+    def total_in_flight(self):
+        return self.in_flight + self.other_in_flight
+
+    def load_key(self):
+        # Fewest in-flight calls first, then the most remaining request budget
+        remaining = self.remaining_requests if self.remaining_requests is not None else float("inf")
+        return (self.total_in_flight(), -remaining, self.index)
+
+    def stats(self, now):
+        return {
+            "key": self.index + 1,
+            "available": self.available(now),
+            "in_flight": self.in_flight,
+            "other_in_flight": self.other_in_flight,
+            "remaining_requests": self.remaining_requests,
+            "remaining_tokens": self.remaining_tokens,
+            "parked_for_s": round(max(0.0, self.parked_until - now), 2),
+            "requests": self.requests,
+            "rate_limited": self.rate_limited,
+        }
+
+
 class GroqKeyManager:
+    """
+    Schedules Groq calls across every configured API key
+
+    Each call goes to the available key with the least load. Budgets come
+    from the x-ratelimit-* headers of every response, so a key whose
+    request or token budget is spent, or that returned 429, is parked until
+    its reset time instead of being retried.
+
+    With GROQ_KEY_STATE_PATH set, budgets, parking and in-flight counts are
+    also kept in a SharedKeyStore, so every worker skips a key that any
+    worker found exhausted instead of discovering it with its own 429.
+    """
+
     def __init__(self):
         # Load all available API keys from environment
         self.api_keys = []
@@ -79,358 +1363,627 @@ class GroqKeyManager:
         
         logger.info(f"Total API keys loaded: {len(self.api_keys)}")
         
-        # Initialize client with first key
-        self.client = Groq(api_key=self.api_keys[self.current_key_index])
-    
-    def get_client(self):
-        """Get current Groq client"""
-        return self.client
+        self.states = [KeyState(index) for index in range(len(self.api_keys))]
+        self.shared = None
+        if GROQ_KEY_STATE_PATH:
+            # An unreachable store leaves this worker on local key state
+            self.shared = self._share(SharedKeyStore, GROQ_KEY_STATE_PATH, self.api_keys, GROQ_KEY_STATE_TIMEOUT_MS)
+            if self.shared is not None:
+                logger.info(f"Sharing API key state through {GROQ_KEY_STATE_PATH}")
+        self.latency = LatencyTracker()
+        self.hedges_sent = 0
+        self.hedges_won = 0
+        self.deadlines_exceeded = 0
+        self.rotations = 0
+
+        # One long-lived async client (and connection pool) per key. The SDK's
+        # own retries are disabled so a 429 reaches execute_hedged and
+        # moves to the next key instead of backing off on the same one.
+        timeout = httpx.Timeout(GROQ_READ_TIMEOUT_S, connect=GROQ_CONNECT_TIMEOUT_S)
+        self.clients = [
+            AsyncGroq(
+                api_key=key,
+                timeout=timeout,
+                max_retries=0,
+                http_client=DefaultAsyncHttpxClient(
+                    timeout=timeout,
+                    event_hooks={"response": [self._response_hook(state)]}
+                )
+            )
+            for key, state in zip(self.api_keys, self.states)
+        ]
     
-    def rotate_key(self):
-        """Rotate to next available API key"""
-        if len(self.api_keys) <= 1:
-            logger.error("No backup keys available!")
-            raise HTTPException(
-                status_code=503,
-                detail="All API keys exhausted. Please try again later."
+    async def aclose(self):
+        """Close every client's connection pool"""
+        for client in self.clients:
+            await client.close()
+        if self.shared is not None:
+            self._share(self.shared.close)
+
+    def _share(self, operation, *args):
+        """Run a SharedKeyStore operation; on failure keep going on local state only"""
+        try:
+            return operation(*args)
+        except sqlite3.Error as e:
+            logger.warning(f"Shared key state unavailable: {str(e)}")
+            return None
+
+    def sync(self):
+        """Merge what other workers have recorded into the local key states"""
+        if self.shared is None:
+            return
+        shared_states = self._share(self.shared.load)
+        if shared_states is None:
+            return
+        for state, shared in zip(self.states, shared_states):
+            state.remaining_requests = shared["remaining_requests"]
+            state.requests_reset_at = shared["requests_reset_at"]
+            state.remaining_tokens = shared["remaining_tokens"]
+            state.tokens_reset_at = shared["tokens_reset_at"]
+            state.parked_until = max(state.parked_until, shared["parked_until"])
+            state.other_in_flight = shared["other_in_flight"]
+
+    def _response_hook(self, state):
+        async def hook(response):
+            self.observe(state, response.status_code, response.headers)
+        return hook
+
+    def observe(self, state, status_code, headers):
+        """Update a key's budget from the rate-limit headers of one response"""
+        now = time.monotonic()
+
+        requests_reported = tokens_reported = False
+
+        remaining_requests = headers.get("x-ratelimit-remaining-requests")
+        if remaining_requests is not None and remaining_requests.isdigit():
+            state.remaining_requests = int(remaining_requests)
+            reset = parse_reset_duration(headers.get("x-ratelimit-reset-requests"))
+            state.requests_reset_at = now + (reset or 0.0)
+            requests_reported = True
+
+        remaining_tokens = headers.get("x-ratelimit-remaining-tokens")
+        if remaining_tokens is not None and remaining_tokens.isdigit():
+            state.remaining_tokens = int(remaining_tokens)
+            reset = parse_reset_duration(headers.get("x-ratelimit-reset-tokens"))
+            state.tokens_reset_at = now + (reset or 0.0)
+            tokens_reported = True
+
+        if self.shared is not None and (requests_reported or tokens_reported):
+            self._share(
+                self.shared.record_budget, state.index,
+                state.remaining_requests if requests_reported else None,
+                state.requests_reset_at if requests_reported else None,
+                state.remaining_tokens if tokens_reported else None,
+                state.tokens_reset_at if tokens_reported else None,
             )
-        
-        self.current_key_index = (self.current_key_index + 1) % len(self.api_keys)
-        self.client = Groq(api_key=self.api_keys[self.current_key_index])
-        logger.warning(f"Rotated to API key #{self.current_key_index + 1}")
-        return self.client
+
+        if status_code == 429:
+            state.rate_limited += 1
+            groq_rate_limited_total.inc(key=state.index + 1)
+            retry_after = parse_reset_duration(headers.get("retry-after"))
+            if retry_after is None:
+                retry_after = max(state.requests_reset_at, state.tokens_reset_at) - now
+                if retry_after <= 0:
+                    retry_after = GROQ_KEY_COOLDOWN_S
+            state.parked_until = max(state.parked_until, now + retry_after)
+            if self.shared is not None:
+                self._share(self.shared.park, state.index, state.parked_until)
+            logger.warning(f"API key #{state.index + 1} parked for {retry_after:.1f}s")
+
+    def acquire(self, exclude=()):
+        """Pick the least-loaded available key, or None if every key is parked or excluded"""
+        self.sync()
+        now = time.monotonic()
+        candidates = [state for state in self.states if state.index not in exclude and state.available(now)]
+        if not candidates:
+            return None
+
+        state = min(candidates, key=KeyState.load_key)
+        state.in_flight += 1
+        state.requests += 1
+        self.current_key_index = state.index
+        if self.shared is not None:
+            self._share(self.shared.set_in_flight, state.index, state.in_flight)
+        return state
+
+    def release(self, state):
+        state.in_flight -= 1
+        if self.shared is not None:
+            self._share(self.shared.set_in_flight, state.index, state.in_flight)
+
+    def seconds_until_available(self):
+        self.sync()
+        now = time.monotonic()
+        return max(0.0, min(state.available_at(now) for state in self.states) - now)
+
+    def available_keys(self):
+        self.sync()
+        now = time.monotonic()
+        return sum(state.available(now) for state in self.states)
+
+    def stats(self):
+        self.sync()
+        now = time.monotonic()
+        return [state.stats(now) for state in self.states]
+
+    def hedging_stats(self):
+        return {
+            "latency": self.latency.stats(),
+            "hedges_sent": self.hedges_sent,
+            "hedges_won": self.hedges_won,
+            "deadlines_exceeded": self.deadlines_exceeded,
+        }
+
+    def rate_limited_error(self):
+        retry_after = max(1, math.ceil(self.seconds_until_available()))
+        return HTTPException(
+            status_code=429,
+            detail=f"All {len(self.api_keys)} API keys are rate limited. Please try again later.",
+            headers={"Retry-After": str(retry_after)}
+        )
     
-    async def execute_with_retry(self, func, *args, max_retries=None, **kwargs):
+    def hedge_delay(self, percent):
+        delay = self.latency.percentile(percent)
+        return delay if delay is not None else INTENT_HEDGE_DEFAULT_MS / 1000
+
+    async def _call(self, state, func, args, kwargs):
+        started = time.perf_counter()
+        try:
+            result = await func(self.clients[state.index], *args, **kwargs)
+            self.latency.record(time.perf_counter() - started)
+            return result
+        finally:
+            self.release(state)
+
+    def _launch(self, tried, func, args, kwargs):
+        state = self.acquire(exclude=tried)
+        if state is None:
+            return None
+        tried.add(state.index)
+        task = asyncio.ensure_future(self._call(state, func, args, kwargs))
+        task.key_index = state.index
+        return task
+
+    async def execute_hedged(self, func, *args, deadline_s, hedge_percentile, accept=None, **kwargs):
         """
-        Execute a function with automatic key rotation on rate limit
-        
+        Execute a function within a deadline, hedging slow calls on a second key
+
+        The first call goes to the least-loaded key. If it has not answered
+        once it is slower than hedge_percentile of recent calls, the same
+        call is sent to another key; the first acceptable answer wins and the
+        other call is cancelled. A 429, connection error or timeout moves on
+        to the next key. When every key is parked, the call waits for the
+        earliest reset if that comes before the deadline, and only fails with
+        429 when it does not; when every key is unreachable it fails with 503.
+        Past deadline_s the request fails with 504.
+
         Args:
-            func: The function to execute
-            max_retries: Maximum number of key rotations (default: number of keys)
-            *args, **kwargs: Arguments to pass to the function
+            func: The function to execute, called as func(client, *args, **kwargs)
+            deadline_s: Total time budget for the request
+            hedge_percentile: Latency percentile after which to hedge
+            accept: Optional predicate; results it rejects do not win
         """
-        if max_retries is None:
-            max_retries = len(self.api_keys)
-        
-        last_error = None
-        
-        for attempt in range(max_retries):
-            try:
-                # Execute the function with current client
-                result = await func(self.get_client(), *args, **kwargs)
-                return result
-                
-            except RateLimitError as e:
-                last_error = e
-                logger.warning(f"Rate limit hit on key #{self.current_key_index + 1}: {str(e)}")
-                
-                if attempt < max_retries - 1:
-                    # Rotate to next key
-                    self.rotate_key()
-                    logger.info(f"Retrying with key #{self.current_key_index + 1}...")
-                else:
-                    logger.error("All API keys exhausted!")
-                    
-            except APIError as e:
-                # For other API errors, don't retry
-                logger.error(f"API Error: {str(e)}")
-                raise HTTPException(status_code=500, detail=f"API Error: {str(e)}")
-            
-            except Exception as e:
-                logger.error(f"Unexpected error: {str(e)}")
-                raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
-        
-        # If we exhausted all retries
-        raise HTTPException(
-            status_code=429,
-            detail=f"All {len(self.api_keys)} API keys are rate limited. Please try again later."
-        )
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + deadline_s
+        # Hedge no later than halfway through the budget so the duplicate can still land
+        hedge_at = loop.time() + min(self.hedge_delay(hedge_percentile), deadline_s / 2)
+        tried = set()
+        pending = set()
+        hedge_task = None
+        fallback = None
+        error = None
+        unreachable = None
 
-# Initialize key manager
-key_manager = GroqKeyManager()
+        try:
+            while True:
+                if not pending and error is None:
+                    task = self._launch(tried, func, args, kwargs)
+                    if task is None:
+                        # Every key is parked or already tried: wait for the
+                        # earliest reset if it still lands inside the deadline
+                        wait = self.seconds_until_available()
+                        if fallback is not None or loop.time() + wait >= deadline:
+                            break
+                        if wait <= 0:
+                            # Keys are free but every one was tried and unreachable
+                            break
+                        logger.info(f"All API keys parked, retrying in {wait:.2f}s")
+                        await asyncio.sleep(wait)
+                        tried.clear()
+                        continue
+                    pending.add(task)
+                if not pending:
+                    break
+
+                wake_at = deadline if hedge_task is not None else min(deadline, hedge_at)
+                done, pending = await asyncio.wait(
+                    pending, timeout=max(0.0, wake_at - loop.time()), return_when=asyncio.FIRST_COMPLETED
+                )
+
+                for task in done:
+                    try:
+                        result = task.result()
+                    except RateLimitError as e:
+                        # observe() has already parked the key from the 429 response
+                        logger.warning(f"Rate limit hit on key #{task.key_index + 1}: {str(e)}")
+                        self.rotations += 1
+                        groq_key_rotations_total.inc()
+                        continue
+                    except APIConnectionError as e:
+                        # Includes timeouts; the next key may take another route
+                        logger.warning(f"Connection failed on key #{task.key_index + 1}: {str(e)}")
+                        unreachable = HTTPException(
+                            status_code=503,
+                            detail="Intent service is unreachable. Please try again.",
+                            headers={"Retry-After": "1"}
+                        )
+                        continue
+                    except APIError as e:
+                        logger.error(f"API Error on key #{task.key_index + 1}: {str(e)}")
+                        error = HTTPException(status_code=500, detail=f"API Error: {str(e)}")
+                        continue
+                    except Exception as e:
+                        logger.error(f"Unexpected error: {str(e)}")
+                        error = HTTPException(status_code=500, detail=f"Error: {str(e)}")
+                        continue
+
+                    if accept is None or accept(result):
+                        if task is hedge_task:
+                            self.hedges_won += 1
+                        return result
+                    fallback = result
+
+                if loop.time() >= deadline:
+                    self.deadlines_exceeded += 1
+                    logger.warning(f"Intent request exceeded its {deadline_s:.1f}s deadline")
+                    raise HTTPException(status_code=504, detail="Intent resolution timed out. Please try again.")
+
+                if not done and hedge_task is None:
+                    hedge_task = self._launch(tried, func, args, kwargs)
+                    if hedge_task is None:
+                        # No second key free; wait out the first call until the deadline
+                        hedge_task = False
+                    else:
+                        self.hedges_sent += 1
+                        logger.info(f"Hedging slow intent call on key #{hedge_task.key_index + 1}")
+                        pending.add(hedge_task)
+        finally:
+            for task in pending:
+                task.cancel()
+
+        if fallback is not None:
+            return fallback
+        if error is not None:
+            raise error
+        if unreachable is not None:
+            raise unreachable
+        logger.error("All API keys exhausted!")
+        raise self.rate_limited_error()
+
+# Initialize key manager (caption-only workers need no Groq keys)
+key_manager = GroqKeyManager() if SERVES_INTENT else None
 
 # ==========================================
-# ENDPOINTS
+# EVENT LOOP LAG MONITOR
 # ==========================================
+class LoopLagMonitor:
+    """
+    Measures how late the event loop wakes up from a fixed-interval sleep
 
-@app.get("/")
-def home():
-    return {
-        "message": "Welcome to RESQ API",
-        "available_keys": len(key_manager.api_keys),
-        "current_key": key_manager.current_key_index + 1
-    }
+    Any lag means some coroutine held the loop (e.g. blocking inference or
+    a synchronous API call) and every other request waited that long.
+    """
 
-@app.get("/api-status")
-def api_status():
-    """Check API key status"""
-    return {
-        "total_keys": len(key_manager.api_keys),
-        "current_key_index": key_manager.current_key_index + 1,
-        "keys_remaining": len(key_manager.api_keys) - key_manager.current_key_index
-    }
+    def __init__(self, interval=0.1, window=600):
+        self.interval = interval
+        self.recent = deque(maxlen=window)
+        self.samples = 0
+        self.max_lag = 0.0
 
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - started - self.interval)
+            self.recent.append(lag)
+            self.samples += 1
+            self.max_lag = max(self.max_lag, lag)
+
+    def stats(self):
+        recent = sorted(self.recent)
+        return {
+            "samples": self.samples,
+            "max_ms": self.max_lag * 1000,
+            "recent_avg_ms": (sum(recent) / len(recent) * 1000) if recent else 0.0,
+            "recent_p99_ms": recent[int(len(recent) * 0.99)] * 1000 if recent else 0.0,
+            "recent_max_ms": recent[-1] * 1000 if recent else 0.0,
+        }
 
 
+loop_lag_monitor = LoopLagMonitor()
 
-async def get_user_intent(client: Groq, text: str) -> dict:
-    """
-    Identifies user intent from spoken or written request using Groq API
-    
-    Args:
-        client: Groq client instance
-        text: User's spoken or written input
-        
-    Returns:
-        dict: Intent detection result with fields:
-              - intent, listen_back, contact_option, want_to_call, want_to_share, response
-    """
+# ==========================================
+# ON-DEMAND PROFILING
+# ==========================================
+# Profiling endpoints are disabled unless an admin token is configured
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN")
+PROFILE_MAX_SECONDS = float(os.environ.get("PROFILE_MAX_SECONDS", "60"))
+PROFILE_SAMPLE_INTERVAL_MS = float(os.environ.get("PROFILE_SAMPLE_INTERVAL_MS", "5"))
+PROFILE_KINDS = ("python", "torch", "both")
 
-    prompt = f"""
-You are an AI assistant that identifies the user's intent based on their spoken or written request.
-
-From the following text, extract exactly ONE intent from these twelve options:
-1. connect_glasses
-2. object_detection
-3. scene_description
-4. ocr
-5. navigation
-6. list_contacts
-7. call_contact
-8. list_share_contacts
-9. share_location
-10. yes_no_response
-11. emergency
-12. settings
-
-
-Text: "{text}"
-
-Return the result in the following strict JSON format:
-
-{{
-  "intent": "<one_of_the_above_twelve>",
-  "listen_back": true/false,
-  "contact_option": null or <integer>,
-  "contact_name": null or "<name>",
-  "want_to_call": true/false,
-  "want_to_share": true/false,
-  "response": "yes" or "no" or null
-}}
-
-Rules:
-- Do NOT add explanations or extra keys.
-- Choose ONLY the most relevant intent based on the text.
-- For all values, use lowercase: true, false, null
-- response field is ONLY used for yes_no_response intent
-- want_to_share field is used for share_location intent
-- contact_name field is used when user mentions a specific person/entity name
-
-INTENT RULES:
-- If the user wants to connect to glasses, or identify connection → use "connect_glasses"
-- If the user is asking to read, extract text, or identify letters/boards → use "ocr"
-- If they want to know what is happening in the surroundings → use "scene_description"
-- If they are asking about a specific item or thing → use "object_detection"
-- If they want directions, movement, or path guidance → use "navigation"
-- If the user asks for emergency or alert to family → use "emergency" 
-- If the user asks for settings or take him to settings → use "settings"
-
-YES/NO RESPONSE RULES:
-- If the user simply says "yes", "yeah", "sure", "okay", "yep", "absolutely" → use "yes_no_response" with response: "yes"
-- If the user simply says "no", "nope", "nah", "not now", "don't", "cancel" → use "yes_no_response" with response: "no"
-- Set all other fields to null/false for yes_no_response
-
-CALL CONTACT RULES:
-- If the user asks "what are my contacts", "list my contacts", "show my contacts", "who can I call" → use "list_contacts" with listen_back: true, want_to_call: false
-- If the user says "I want to call", "call someone", "make a call", "call a contact" (without specifying a name) → use "list_contacts" with listen_back: true, want_to_call: false
-- If the user specifies "call option 1", "call option 2", "call the first", "dial option 1", etc. → use "call_contact" with listen_back: false, contact_option: <number>, want_to_call: true
-- If the user mentions ANY name after call/dial/phone keywords: "call [NAME]", "dial [NAME]", "phone [NAME]", "ring [NAME]" → use "call_contact" with listen_back: false, contact_name: "<extract_exact_name>", want_to_call: true
-- IMPORTANT: Extract the EXACT name as spoken by the user. Do not validate if the name exists. Just extract whatever name is mentioned after the action verb (call/dial/phone).
-- Examples of name extraction:
-  * "call Pradeep" → contact_name: "Pradeep"
-  * "call mom" → contact_name: "mom"
-  * "dial Sarah Johnson" → contact_name: "Sarah Johnson"
-  * "phone office" → contact_name: "office"
-  * "call doctor smith" → contact_name: "doctor smith"
-  * "ring my brother" → contact_name: "my brother"
-- If the user confirms a call after hearing the contact → use "call_contact" with listen_back: false, contact_option: <last_heard_option>, want_to_call: true
-- listen_back: true means ask for confirmation before proceeding
-- listen_back: false means directly process the call
-- want_to_call: true when user explicitly wants to initiate a call
-- contact_name: extract EXACTLY whatever name/entity the user mentions after the action verb, including titles, multiple words, or descriptive terms
-
-SHARE LOCATION RULES:
-- If the user asks "share my location", "share location", "/share", "share my current location", "send my location", "share where I am" (without specifying a recipient) → use "list_share_contacts" with listen_back: true, want_to_share: false
-- If the user says "I want to share", "share with someone", "share location with contacts", "send my location to contacts" (without specifying a recipient) → use "list_share_contacts" with listen_back: true, want_to_share: false
-- If the user specifies "share with option 1", "share to option 2", "share with the first", "send to option 1", etc. → use "share_location" with listen_back: false, contact_option: <number>, want_to_share: true
-- If the user mentions ANY name with share/send keywords: "share location with [NAME]", "send location to [NAME]", "share with [NAME]" → use "share_location" with listen_back: false, contact_name: "<extract_exact_name>", want_to_share: true
-- IMPORTANT: Extract the EXACT name as spoken by the user. Do not validate if the name exists. Just extract whatever name is mentioned after the share/send action.
-- Examples of name extraction:
-  * "share location with Pradeep" → contact_name: "Pradeep"
-  * "send location to home" → contact_name: "home"
-  * "share with Sarah Johnson" → contact_name: "Sarah Johnson"
-  * "send my location to office" → contact_name: "office"
-  * "share where I am with doctor" → contact_name: "doctor"
-  * "send to my brother" → contact_name: "my brother"
-- If the user confirms sharing after hearing the contact → use "share_location" with listen_back: false, contact_option: <last_heard_option>, want_to_share: true
-- If the user says "share with all" or "share with everyone" → use "share_location" with listen_back: false, contact_option: -1 (represents all contacts), want_to_share: true
-- listen_back: true means ask for confirmation before sharing
-- listen_back: false means directly process the share
-- want_to_share: true when user explicitly wants to share location
-- contact_option: -1 means share with all contacts; positive integer (1, 2, 3...) means specific contact
-- contact_name: extract EXACTLY whatever name/entity the user mentions after share/send keywords, including titles, multiple words, or descriptive terms
-
-EXAMPLES:
-1. User: "Show me my contacts"
-   Response: {{"intent": "list_contacts", "listen_back": true, "contact_option": null, "contact_name": null, "want_to_call": false, "want_to_share": false, "response": null}}
-
-2. User: "I want to call someone"
-   Response: {{"intent": "list_contacts", "listen_back": true, "contact_option": null, "contact_name": null, "want_to_call": false, "want_to_share": false, "response": null}}
-
-3. User: "Call option number 1"
-   Response: {{"intent": "call_contact", "listen_back": false, "contact_option": 1, "contact_name": null, "want_to_call": true, "want_to_share": false, "response": null}}
-
-4. User: "Call option number 2"
-   Response: {{"intent": "call_contact", "listen_back": false, "contact_option": 2, "contact_name": null, "want_to_call": true, "want_to_share": false, "response": null}}
-
-5. User: "Call option number 3"
-   Response: {{"intent": "call_contact", "listen_back": false, "contact_option": 3, "contact_name": null, "want_to_call": true, "want_to_share": false, "response": null}}
-
-6. User: "Call option number 4"
-   Response: {{"intent": "call_contact", "listen_back": false, "contact_option": 4, "contact_name": null, "want_to_call": true, "want_to_share": false, "response": null}}
-
-7. User: "Yes"
-   Response: {{"intent": "yes_no_response", "listen_back": false, "contact_option": null, "contact_name": null, "want_to_call": false, "want_to_share": false, "response": "yes"}}
 
-8. User: "No"
-   Response: {{"intent": "yes_no_response", "listen_back": false, "contact_option": null, "contact_name": null, "want_to_call": false, "want_to_share": false, "response": "no"}}
-
-9. User: "Yes, call the first contact"
-   Response: {{"intent": "call_contact", "listen_back": false, "contact_option": 1, "contact_name": null, "want_to_call": true, "want_to_share": false, "response": null}}
-
-10. User: "Yes, call the second contact"
-    Response: {{"intent": "call_contact", "listen_back": false, "contact_option": 2, "contact_name": null, "want_to_call": true, "want_to_share": false, "response": null}}
-
-11. User: "Yes, call the third contact"
-    Response: {{"intent": "call_contact", "listen_back": false, "contact_option": 3, "contact_name": null, "want_to_call": true, "want_to_share": false, "response": null}}
+class ProfileCapture:
+    """One bounded capture window; ends after max_requests requests or on timeout"""
 
-12. User: "Yes, call the fourth contact"
-    Response: {{"intent": "call_contact", "listen_back": false, "contact_option": 4, "contact_name": null, "want_to_call": true, "want_to_share": false, "response": null}}
+    def __init__(self, max_requests):
+        self.max_requests = max_requests
+        self.requests = 0
+        self.finished = asyncio.Event()
 
-13. User: "Share my location"
-    Response: {{"intent": "list_share_contacts", "listen_back": true, "contact_option": null, "contact_name": null, "want_to_call": false, "want_to_share": false, "response": null}}
+    def request_done(self, path):
+        if path.startswith("/admin/"):
+            return
+        self.requests += 1
+        if self.max_requests and self.requests >= self.max_requests:
+            self.finished.set()
 
-14. User: "/share"
-    Response: {{"intent": "list_share_contacts", "listen_back": true, "contact_option": null, "contact_name": null, "want_to_call": false, "want_to_share": false, "response": null}}
 
-15. User: "Share location with option 1"
-    Response: {{"intent": "share_location", "listen_back": false, "contact_option": 1, "contact_name": null, "want_to_call": false, "want_to_share": true, "response": null}}
+# The capture in progress, if any. Checked once per request, so a worker
+# that is not being profiled pays for nothing else.
+profile_capture = None
 
-16. User: "Share location with option number 2"
-    Response: {{"intent": "share_location", "listen_back": false, "contact_option": 2, "contact_name": null, "want_to_call": false, "want_to_share": true, "response": null}}
 
-17. User: "Share location with option 3"
-    Response: {{"intent": "share_location", "listen_back": false, "contact_option": 3, "contact_name": null, "want_to_call": false, "want_to_share": true, "response": null}}
+class ProfileRequestCounter:
+    """ASGI middleware counting finished requests toward an active capture"""
 
-18. User: "Share location with option 4"
-    Response: {{"intent": "share_location", "listen_back": false, "contact_option": 4, "contact_name": null, "want_to_call": false, "want_to_share": true, "response": null}}
+    def __init__(self, app):
+        self.app = app
 
-19. User: "Share with all contacts"
-    Response: {{"intent": "share_location", "listen_back": false, "contact_option": -1, "contact_name": null, "want_to_call": false, "want_to_share": true, "response": null}}
+    async def __call__(self, scope, receive, send):
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            if profile_capture is not None and scope["type"] in ("http", "websocket"):
+                profile_capture.request_done(scope["path"])
 
-20. User: "Yes, share my location to option 1"
-    Response: {{"intent": "share_location", "listen_back": false, "contact_option": 1, "contact_name": null, "want_to_call": false, "want_to_share": true, "response": null}}
 
-21. User: "Yes, share my location to option 2"
-    Response: {{"intent": "share_location", "listen_back": false, "contact_option": 2, "contact_name": null, "want_to_call": false, "want_to_share": true, "response": null}}
+app.add_middleware(ProfileRequestCounter)
 
-22. User: "Yes, share my location to option 3"
-    Response: {{"intent": "share_location", "listen_back": false, "contact_option": 3, "contact_name": null, "want_to_call": false, "want_to_share": true, "response": null}}
 
-23. User: "Yes, share my location to option 4"
-    Response: {{"intent": "share_location", "listen_back": false, "contact_option": 4, "contact_name": null, "want_to_call": false, "want_to_share": true, "response": null}}
+def require_admin(request: Request):
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    token = request.headers.get("x-admin-token", "")
+    if not hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
 
-24. User: "Send my location to option 1"
-    Response: {{"intent": "share_location", "listen_back": false, "contact_option": 1, "contact_name": null, "want_to_call": false, "want_to_share": true, "response": null}}
 
-25. User: "Send my location to option 2"
-    Response: {{"intent": "share_location", "listen_back": false, "contact_option": 2, "contact_name": null, "want_to_call": false, "want_to_share": true, "response": null}}
+def start_torch_profiler():
+    """Runs on the inference thread, which is where every model call happens"""
+    import torch
+    profiler = torch.profiler.profile(activities=[torch.profiler.ProfilerActivity.CPU], record_shapes=True)
+    profiler.__enter__()
+    return profiler
 
-26. User: "Send my location to option 3"
-    Response: {{"intent": "share_location", "listen_back": false, "contact_option": 3, "contact_name": null, "want_to_call": false, "want_to_share": true, "response": null}}
 
-27. User: "Send my location to option 4"
-    Response: {{"intent": "share_location", "listen_back": false, "contact_option": 4, "contact_name": null, "want_to_call": false, "want_to_share": true, "response": null}}
+def stop_torch_profiler(profiler) -> bytes:
+    profiler.__exit__(None, None, None)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "torch_trace.json")
+        profiler.export_chrome_trace(path)
+        with open(path, "rb") as f:
+            return f.read()
 
-28. User: "Yes, I want to share"
-    Response: {{"intent": "share_location", "listen_back": false, "contact_option": null, "contact_name": null, "want_to_call": false, "want_to_share": true, "response": null}}
 
-29. User: "No, don't share"
-    Response: {{"intent": "yes_no_response", "listen_back": false, "contact_option": null, "contact_name": null, "want_to_call": false, "want_to_share": false, "response": "no"}}
+@app.post("/admin/profile")
+async def capture_profile(request: Request, seconds: float = 10.0, max_requests: int = 0, kind: str = "python"):
+    """
+    Profile this worker for a bounded window and return the artifact
 
-30. User: "Navigate to home"
-    Response: {{"intent": "navigation", "listen_back": false, "contact_option": null, "contact_name": null, "want_to_call": false, "want_to_share": false, "response": null}}
+    Requires the X-Admin-Token header to match ADMIN_TOKEN. The capture ends
+    after `seconds` (at most PROFILE_MAX_SECONDS) or once `max_requests`
+    other requests have finished, whichever comes first.
 
-31. User: "I need help"
-    Response: {{"intent": "emergency", "listen_back": false, "contact_option": 1, "contact_name": null, "want_to_call": true, "want_to_share": true, "response": null}}
+    kind:
+        python: sampled Python stacks of all threads, folded flame graph format
+        torch: torch operator trace of caption inference, chrome trace JSON
+        both: a zip with both artifacts
+    """
+    global profile_capture
+    require_admin(request)
+    if kind not in PROFILE_KINDS:
+        raise HTTPException(status_code=400, detail=f"kind must be one of {PROFILE_KINDS}")
+    if kind != "python" and caption_status["state"] != "ready":
+        raise HTTPException(status_code=409, detail=f"Caption model is {caption_status['state']}, "
+                                                    f"torch profiling needs it loaded")
+    if profile_capture is not None:
+        raise HTTPException(status_code=409, detail="A profile capture is already running")
+
+    seconds = min(max(seconds, 0.1), PROFILE_MAX_SECONDS)
+    loop = asyncio.get_running_loop()
+    capture = profile_capture = ProfileCapture(max_requests)
+    sampler = None
+    torch_profiler = None
+    started = time.perf_counter()
 
-32. User: "Help me"
-    Response: {{"intent": "emergency", "listen_back": false, "contact_option": 1, "contact_name": null, "want_to_call": true, "want_to_share": true, "response": null}}
+    try:
+        if kind in ("python", "both"):
+            sampler = SamplingProfiler(interval_s=PROFILE_SAMPLE_INTERVAL_MS / 1000)
+            sampler.start()
+        if kind in ("torch", "both"):
+            torch_profiler = await loop.run_in_executor(inference_executor, start_torch_profiler)
 
-33. User: "It's an emergency"
-    Response: {{"intent": "emergency", "listen_back": false, "contact_option": 1, "contact_name": null, "want_to_call": true, "want_to_share": true, "response": null}}
+        try:
+            await asyncio.wait_for(capture.finished.wait(), timeout=seconds)
+        except asyncio.TimeoutError:
+            pass
+    finally:
+        profile_capture = None
+        if sampler is not None:
+            await run_in_threadpool(sampler.stop)
+        trace = None
+        if torch_profiler is not None:
+            trace = await loop.run_in_executor(inference_executor, stop_torch_profiler, torch_profiler)
+
+    elapsed = time.perf_counter() - started
+    headers = {
+        "X-Profile-Seconds": f"{elapsed:.2f}",
+        "X-Profile-Requests": str(capture.requests),
+    }
+    logger.info(f"Profile capture ({kind}) finished after {elapsed:.1f}s and {capture.requests} requests")
+
+    if kind == "python":
+        headers["Content-Disposition"] = 'attachment; filename="profile.folded"'
+        return PlainTextResponse(sampler.folded(), headers=headers)
+    if kind == "torch":
+        headers["Content-Disposition"] = 'attachment; filename="torch_trace.json"'
+        return Response(trace, media_type="application/json", headers=headers)
+
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, "w", zipfile.ZIP_DEFLATED) as bundle:
+        bundle.writestr("profile.folded", sampler.folded())
+        bundle.writestr("torch_trace.json", trace)
+    headers["Content-Disposition"] = 'attachment; filename="profile.zip"'
+    return Response(archive.getvalue(), media_type="application/zip", headers=headers)
 
-34. User: "ALERT FAMILY"
-    Response: {{"intent": "emergency", "listen_back": false, "contact_option": 1, "contact_name": null, "want_to_call": true, "want_to_share": true, "response": null}}
+# ==========================================
+# ENDPOINTS
+# ==========================================
 
-35. User: "Call Pradeep"
-    Response: {{"intent": "call_contact", "listen_back": false, "contact_option": null, "contact_name": "Pradeep", "want_to_call": true, "want_to_share": false, "response": null}}
+@app.get("/")
+def home():
+    return {
+        "message": "Welcome to RESQ API",
+        "role": SERVER_ROLE,
+        "available_keys": len(key_manager.api_keys) if key_manager else 0,
+        "current_key": key_manager.current_key_index + 1 if key_manager else None
+    }
 
-36. User: "Call home"
-    Response: {{"intent": "call_contact", "listen_back": false, "contact_option": null, "contact_name": "home", "want_to_call": true, "want_to_share": false, "response": null}}
+@app.get("/ready")
+def ready():
+    """Readiness check: 200 once every component this worker serves can take traffic"""
+    is_ready = not SERVES_CAPTION or caption_status["state"] == "ready"
+    return JSONResponse(
+        status_code=200 if is_ready else 503,
+        content={
+            "ready": is_ready,
+            "role": SERVER_ROLE,
+            "caption": caption_status,
+        }
+    )
+
+def worker_memory():
+    """rss/pss/private MB of this worker; pss counts shared model pages fractionally"""
+    if not SERVES_CAPTION:
+        return None
+    from caption_model import process_memory_mb
+    return {"pid": os.getpid(), **process_memory_mb()}
+
+
+@app.get("/api-status")
+def api_status():
+    """Check API key status"""
+    return {
+        "role": SERVER_ROLE,
+        "event_loop_lag": loop_lag_monitor.stats(),
+        "admission": admission.stats(),
+        "total_keys": len(key_manager.api_keys) if key_manager else 0,
+        "current_key_index": key_manager.current_key_index + 1 if key_manager else None,
+        "keys_remaining": key_manager.available_keys() if key_manager else 0,
+        "key_rotations": key_manager.rotations if key_manager else 0,
+        "keys": key_manager.stats() if key_manager else [],
+        "intent_hedging": key_manager.hedging_stats() if key_manager else None,
+        "intent_fastpath": intent_classifier.stats() if intent_classifier else None,
+        "intent_cache": intent_cache.stats(),
+        "intent_prompt": intent_prompt.stats(),
+        "caption_model": caption_status,
+        "caption_precision": caption_precision,
+        "caption_fast_model": CAPTION_FAST_MODEL or None,
+        "worker_memory": worker_memory(),
+        "caption_batching": caption_batcher.stats(),
+        "caption_cache": caption_cache.stats(),
+        "vision_cache": vision_cache.stats(),
+        "caption_stages": caption_timings.stats()
+    }
 
-37. User: "Dial mom"
-    Response: {{"intent": "call_contact", "listen_back": false, "contact_option": null, "contact_name": "mom", "want_to_call": true, "want_to_share": false, "response": null}}
 
-38. User: "Call John please"
-    Response: {{"intent": "call_contact", "listen_back": false, "contact_option": null, "contact_name": "John", "want_to_call": true, "want_to_share": false, "response": null}}
 
-39. User: "Phone dad"
-    Response: {{"intent": "call_contact", "listen_back": false, "contact_option": null, "contact_name": "dad", "want_to_call": true, "want_to_share": false, "response": null}}
 
-40. User: "Call doctor Smith"
-    Response: {{"intent": "call_contact", "listen_back": false, "contact_option": null, "contact_name": "doctor Smith", "want_to_call": true, "want_to_share": false, "response": null}}
+@metrics.collector
+def collect_component_metrics():
+    """Counters and gauges that the caches, key manager and batcher already keep"""
+    caches = [("caption", caption_cache), ("intent", intent_cache), ("vision", vision_cache)]
+    yield ("classecho_cache_hits_total", "counter", "Cache lookups answered from the cache",
+           [({"cache": name}, cache.hits) for name, cache in caches]
+           + [({"cache": "intent_coalesced"}, intent_cache.coalesced)])
+    yield ("classecho_cache_misses_total", "counter", "Cache lookups that had to compute the result",
+           [({"cache": name}, cache.misses) for name, cache in caches])
 
-41. User: "Ring my brother"
-    Response: {{"intent": "call_contact", "listen_back": false, "contact_option": null, "contact_name": "my brother", "want_to_call": true, "want_to_share": false, "response": null}}
+    if intent_classifier is not None:
+        yield ("classecho_intent_fastpath_total", "counter", "Intent requests by local fast-path outcome",
+               [({"outcome": "hit"}, intent_classifier.hits), ({"outcome": "fallback"}, intent_classifier.fallbacks)])
 
-42. User: "Call anyone whose name is Rajesh"
-    Response: {{"intent": "call_contact", "listen_back": false, "contact_option": null, "contact_name": "Rajesh", "want_to_call": true, "want_to_share": false, "response": null}}
+    if key_manager is not None:
+        yield ("classecho_groq_requests_total", "counter", "Groq calls started per API key",
+               [({"key": state.index + 1}, state.requests) for state in key_manager.states])
+        yield ("classecho_groq_in_flight", "gauge", "Groq calls currently in flight per API key",
+               [({"key": state.index + 1}, state.in_flight) for state in key_manager.states])
+        yield ("classecho_groq_keys_available", "gauge", "API keys not parked or out of budget",
+               [({}, key_manager.available_keys())])
+        yield ("classecho_intent_hedges_total", "counter", "Hedged duplicate intent calls",
+               [({"outcome": "sent"}, key_manager.hedges_sent), ({"outcome": "won"}, key_manager.hedges_won)])
+        yield ("classecho_intent_deadline_exceeded_total", "counter", "Intent requests that ran past their deadline",
+               [({}, key_manager.deadlines_exceeded)])
 
-43. User: "Share location with Pradeep"
-    Response: {{"intent": "share_location", "listen_back": false, "contact_option": null, "contact_name": "Pradeep", "want_to_call": false, "want_to_share": true, "response": null}}
+    yield ("classecho_caption_images_total", "counter", "Images captioned by the batcher",
+           [({}, caption_batcher.images_captioned)])
+    yield ("classecho_caption_batches_total", "counter", "Batched generate calls run",
+           [({}, caption_batcher.batches_run)])
+    yield ("classecho_caption_rejected_total", "counter", "Caption requests rejected with 503",
+           [({}, caption_batcher.rejected)])
+    yield ("classecho_caption_queue_depth", "gauge", "Caption requests waiting or being generated",
+           [({}, caption_batcher.depth())])
+    yield ("classecho_caption_model_ready", "gauge", "1 when the caption model is loaded and warm",
+           [({}, int(caption_status["state"] == "ready"))])
 
-44. User: "Share my location with home"
-    Response: {{"intent": "share_location", "listen_back": false, "contact_option": null, "contact_name": "home", "want_to_call": false, "want_to_share": true, "response": null}}
+    yield ("classecho_admission_running", "gauge", "Admitted requests per priority class",
+           [({"priority": name}, count) for name, count in admission.running.items()])
+    yield ("classecho_admission_waiting", "gauge", "Requests queued for admission per priority class",
+           [({"priority": name}, len(queue)) for name, queue in admission.waiters.items()])
 
-45. User: "Send location to mom"
-    Response: {{"intent": "share_location", "listen_back": false, "contact_option": null, "contact_name": "mom", "want_to_call": false, "want_to_share": true, "response": null}}
+    yield ("classecho_event_loop_lag_seconds", "gauge", "Worst event loop lag in the recent window",
+           [({}, loop_lag_monitor.stats()["recent_max_ms"] / 1000)])
 
-46. User: "Share where I am with John"
-    Response: {{"intent": "share_location", "listen_back": false, "contact_option": null, "contact_name": "John", "want_to_call": false, "want_to_share": true, "response": null}}
 
-47. User: "Send my location to Prajwal"
-    Response: {{"intent": "share_location", "listen_back": false, "contact_option": null, "contact_name": "Prajwal", "want_to_call": false, "want_to_share": true, "response": null}}
+@app.get("/metrics")
+def prometheus_metrics():
+    """Prometheus text exposition of this worker's metrics"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
 
-48. User: "Share with doctor"
-    Response: {{"intent": "share_location", "listen_back": false, "contact_option": null, "contact_name": "doctor", "want_to_call": false, "want_to_share": true, "response": null}}
 
-49. User: "Send location to my brother"
-    Response: {{"intent": "share_location", "listen_back": false, "contact_option": null, "contact_name": "my brother", "want_to_call": false, "want_to_share": true, "response": null}}
+# Few-shot examples sent with each LLM intent request
+INTENT_PROMPT_EXAMPLES = int(os.environ.get("INTENT_PROMPT_EXAMPLES", "6"))
 
-50. User: "Share my location with anyone named Kumar"
-    Response: {{"intent": "share_location", "listen_back": false, "contact_option": null, "contact_name": "Kumar", "want_to_call": false, "want_to_share": true, "response": null}}
-"""
+intent_prompt = IntentPrompt(k=INTENT_PROMPT_EXAMPLES)
+
+
+async def get_user_intent(client: AsyncGroq, text: str) -> dict:
+    """
+    Identifies user intent from spoken or written request using Groq API
+    
+    Args:
+        client: AsyncGroq client instance
+        text: User's spoken or written input
+        
+    Returns:
+        dict: Intent detection result with fields:
+              - intent, listen_back, contact_option, want_to_call, want_to_share, response
+    """
+
+    started = time.perf_counter()
+    messages = intent_prompt.build_messages(text)
+    intent_stage_seconds.observe(time.perf_counter() - started, stage="prompt_build")
     
 #     prompt = f"""
 # You are an AI assistant that identifies the user's intent based on their spoken or written request.
@@ -609,22 +2162,35 @@ EXAMPLES:
     
     try:
         # Call Groq API
-        response = client.chat.completions.create(
+        started = time.perf_counter()
+        response = await client.chat.completions.create(
             model="llama-3.3-70b-versatile",
-            messages=[{"role": "user", "content": prompt}],
+            messages=messages,
             temperature=0.3,
             response_format={"type": "json_object"}
         )
+        intent_stage_seconds.observe(time.perf_counter() - started, stage="groq_round_trip")
+
+        usage = response.usage
+        if usage is not None:
+            prompt_tokens, completion_tokens = usage.prompt_tokens, usage.completion_tokens
+        else:
+            prompt_tokens = sum(estimate_tokens(message["content"]) for message in messages)
+            completion_tokens = 0
+        intent_prompt.record_usage(prompt_tokens, completion_tokens)
+        logger.info(f"Intent tokens: prompt={prompt_tokens} completion={completion_tokens} "
+                    f"examples={(len(messages) - 2) // 2}")
 
         raw_output = response.choices[0].message.content.strip()
-        print(f"Raw API Response: {raw_output}")
+        logger.debug(f"Raw API Response: {raw_output}")
 
         # Try to parse JSON
+        started = time.perf_counter()
         try:
             intent_data = json.loads(raw_output)
         except json.JSONDecodeError:
             # Fallback: extract JSON from response if it contains extra text
-            print("⚠️ JSON parsing failed, attempting to extract JSON from response...")
+            logger.warning("JSON parsing failed, attempting to extract JSON from response")
             start = raw_output.find("{")
             end = raw_output.rfind("}") + 1
             
@@ -632,7 +2198,8 @@ EXAMPLES:
                 json_str = raw_output[start:end]
                 intent_data = json.loads(json_str)
             else:
-                print("❌ Could not extract valid JSON")
+                logger.warning(f"Could not extract valid JSON from: {raw_output}")
+                intent_parse_fallbacks_total.inc(result="unknown")
                 return {
                     "intent": "unknown",
                     "listen_back": False,
@@ -648,13 +2215,18 @@ EXAMPLES:
             if field not in intent_data:
                 intent_data[field] = None
 
-        print(f"✅ Parsed Intent Data: {intent_data}")
-        print(f"📊 Intent Type: {intent_data.get('intent', 'unknown')}")
-        
+        intent_stage_seconds.observe(time.perf_counter() - started, stage="json_parse")
+        logger.debug(f"Parsed Intent Data: {intent_data}")
+
         return intent_data
 
+    except APIError:
+        # Rate limits and API failures are handled by the key manager
+        raise
+
     except Exception as e:
-        print(f"❌ Error in get_user_intent: {e}")
+        logger.error(f"Error in get_user_intent: {e}")
+        intent_parse_fallbacks_total.inc(result="error")
         return {
             "intent": "error",
             "listen_back": False,
@@ -668,22 +2240,240 @@ EXAMPLES:
 
 
 
+# ==========================================
+# LOCAL INTENT FAST PATH
+# ==========================================
+# Utterances the local classifier is confident about never reach Groq
+INTENT_FASTPATH = os.environ.get("INTENT_FASTPATH", "1") != "0"
+INTENT_FASTPATH_MIN_CONFIDENCE = float(os.environ.get("INTENT_FASTPATH_MIN_CONFIDENCE", "0.85"))
+intent_classifier = IntentClassifier(min_confidence=INTENT_FASTPATH_MIN_CONFIDENCE) if INTENT_FASTPATH else None
+
+# ==========================================
+# INTENT RESULT CACHE
+# ==========================================
+INTENT_CACHE_SIZE = int(os.environ.get("INTENT_CACHE_SIZE", "1024"))
+INTENT_CACHE_TTL_S = float(os.environ.get("INTENT_CACHE_TTL_S", "600"))
+
+
+class IntentCache:
+    """
+    LRU + TTL cache of LLM intent results keyed on normalized transcript text
+
+    Concurrent requests for the same transcript are collapsed into a single
+    in-flight call (single flight): the first request starts it and later ones
+    await the same result. The call runs as its own task, so a client that
+    disconnects does not cancel it for the others. Failed and unparseable
+    results are never cached.
+    """
+
+    UNCACHEABLE_INTENTS = {"unknown", "error"}
+
+    def __init__(self, max_size=INTENT_CACHE_SIZE, ttl=INTENT_CACHE_TTL_S):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()  # normalized text -> (result, stored_at)
+        self.in_flight = {}  # normalized text -> asyncio.Task
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def _lookup(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        result, stored_at = entry
+        if time.monotonic() - stored_at > self.ttl:
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return result
+
+    def _finish(self, key, task):
+        self.in_flight.pop(key, None)
+        if task.cancelled() or task.exception() is not None:
+            return
+
+        result = task.result()
+        if self.max_size > 0 and result.get("intent") not in self.UNCACHEABLE_INTENTS:
+            self.entries[key] = (result, time.monotonic())
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    async def get_or_compute(self, text, compute):
+        """
+        Return the cached result for text, or await compute() (shared with any
+        identical request already in flight)
+        """
+        key = normalize_transcript(text)
+        if not key:
+            return await compute()
+
+        cached = self._lookup(key)
+        if cached is not None:
+            self.hits += 1
+            return dict(cached)
+
+        task = self.in_flight.get(key)
+        if task is None:
+            self.misses += 1
+            task = asyncio.ensure_future(compute())
+            self.in_flight[key] = task
+            task.add_done_callback(lambda done: self._finish(key, done))
+        else:
+            self.coalesced += 1
+
+        return dict(await asyncio.shield(task))
+
+    def stats(self):
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "size": len(self.entries),
+            "max_size": self.max_size,
+            "ttl_s": self.ttl,
+            "in_flight": len(self.in_flight),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "hit_rate": ((self.hits + self.coalesced) / lookups) if lookups else 0.0,
+        }
+
+
+intent_cache = IntentCache()
+
+
+async def resolve_intent(audioText: str) -> dict:
+    """Intent for a transcript: local fast path first, then the cached, hedged LLM call"""
+    if intent_classifier is not None:
+        local_result = intent_classifier.classify(audioText)
+        if local_result is not None:
+            logger.info(f"Intent resolved locally: {local_result['intent']} "
+                        f"(confidence {local_result['confidence']})")
+            return local_result
+
+    # Possible emergencies are spotted before the LLM call so they get
+    # priority admission and a tighter deadline
+    if looks_urgent(audioText):
+        priority = "emergency"
+        deadline_s, hedge_percentile = INTENT_EMERGENCY_DEADLINE_S, INTENT_EMERGENCY_HEDGE_PERCENTILE
+    else:
+        priority = "intent"
+        deadline_s, hedge_percentile = INTENT_DEADLINE_S, INTENT_HEDGE_PERCENTILE
+
+    async with admission.admit(priority):
+        intent_result = await intent_cache.get_or_compute(
+            audioText,
+            lambda: key_manager.execute_hedged(
+                get_user_intent, audioText,
+                deadline_s=deadline_s,
+                hedge_percentile=hedge_percentile,
+                accept=lambda result: result.get("intent") != "error"
+            )
+        )
+
+    logger.info(f"Intent resolved by LLM: {intent_result.get('intent')}")
+    return intent_result
+
+
+def require_intent_role():
+    if not SERVES_INTENT:
+        raise HTTPException(status_code=404, detail=f"Intents are not served by this '{SERVER_ROLE}' worker")
+
+
 @app.post("/get_user_intent")
 async def get_intent(request: Request):
+    require_intent_role()
+
     try:
         data = await request.json()
         audioText = data.get("audioText", "").strip()
-        print("Received audioText:", audioText)
-        logger.info("Starting intent Processing")
+        logger.debug(f"Received audioText: {audioText}")
 
-        intent_result = await key_manager.execute_with_retry(
-            get_user_intent,
-            audioText
-        )
+        return JSONResponse(content=await resolve_intent(audioText))
 
-        logger.info("Intent generation was success", intent_result)
-        return JSONResponse(content=intent_result)
+    except HTTPException:
+        raise
     
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+# ==========================================
+# COMBINED ASSIST (INTENT + SPECULATIVE CAPTION)
+# ==========================================
+# Intents whose answer needs a caption of the current frame
+ASSIST_CAPTION_INTENTS = {"scene_description"}
+
+
+async def speculative_caption(file: UploadFile):
+    async with admission.admit("caption"):
+        contents = await read_upload(file)
+        pixel_values, image_hash = await run_in_threadpool(prepare_image, contents)
+        return await cached_caption(pixel_values, image_hash)
+
+
+@app.post("/assist")
+async def assist(audioText: str = Form(...), file: Optional[UploadFile] = File(None)):
+    """
+    Intent and, when the intent needs it, a caption of the frame, in one round trip
+
+    The frame (multipart field "file") is captioned while the intent is being
+    resolved, so "what's around me" costs max(intent, caption) instead of
+    their sum. If the intent does not need a caption, the caption is
+    cancelled: a frame still queued for a batch is dropped, and a running
+    batch stops generating once no request in it still wants a caption.
+
+    Returns the /get_user_intent result plus "caption" (null unless the
+    intent needs one), the "caption_tier" that produced it, and
+    "caption_error" when it was needed but failed.
+    """
+    require_intent_role()
+    audioText = audioText.strip()
+    logger.debug(f"Received assist audioText: {audioText}")
+
+    caption_task = None
+    caption_error = None
+    if file is not None:
+        try:
+            require_caption_ready()
+            caption_task = asyncio.ensure_future(speculative_caption(file))
+            # Marks the exception retrieved when the caption is not awaited
+            caption_task.add_done_callback(lambda task: task.cancelled() or task.exception())
+        except HTTPException as e:
+            caption_error = e.detail
+
+    try:
+        intent_result = await resolve_intent(audioText)
+
+        caption = caption_tier = None
+        if caption_task is not None:
+            if intent_result.get("intent") in ASSIST_CAPTION_INTENTS:
+                try:
+                    caption, caption_tier = await caption_task
+                    assist_speculation_total.inc(outcome="used")
+                except HTTPException as e:
+                    caption_error = e.detail
+                    assist_speculation_total.inc(outcome="failed")
+                except Exception as e:
+                    logger.error(f"Assist caption failed: {str(e)}")
+                    caption_error = str(e)
+                    assist_speculation_total.inc(outcome="failed")
+            else:
+                caption_task.cancel()
+                assist_speculation_total.inc(outcome="cancelled")
+
+        content = {**intent_result, "caption": caption, "caption_tier": caption_tier}
+        if caption_error is not None and intent_result.get("intent") in ASSIST_CAPTION_INTENTS:
+            content["caption_error"] = caption_error
+        return JSONResponse(content=content)
+
+    except HTTPException:
+        raise
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    finally:
+        # Client gone or intent failed: the speculative caption is not needed
+        if caption_task is not None and not caption_task.done():
+            caption_task.cancel()
         
\ No newline at end of file
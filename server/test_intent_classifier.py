@@ -0,0 +1,56 @@
+from intent_classifier import UNRESOLVED, IntentClassifier, intent_result
+
+classifier = IntentClassifier()
+
+
+def test_plain_emergency_is_resolved_locally():
+    assert classifier.classify("help me")["intent"] == "emergency"
+
+
+def test_urgent_utterances_fall_back_to_llm():
+    for text in [
+        "What is happening around me, help",
+        "share my location help",
+        "I fell what do you see",
+        "describe my surroundings I am scared",
+    ]:
+        assert classifier.classify(text) is None, text
+
+
+def test_unknown_words_lower_similarity():
+    assert classifier.classify("what is happening around me")["intent"] == "scene_description"
+    assert classifier.classify("what is happening around me xyzzy qwfp blorf") is None
+
+
+def test_call_rules():
+    assert classifier.match_rules("Call mom") == (intent_result("call_contact", contact_name="mom", want_to_call=True), 0.9)
+    assert classifier.match_rules("call option number 3")[0]["contact_option"] == 3
+    assert classifier.match_rules("call the second contact")[0]["contact_option"] == 2
+    assert classifier.match_rules("call someone")[0]["intent"] == "list_contacts"
+    assert classifier.match_rules("call me a taxi") == UNRESOLVED
+    assert classifier.match_rules("call an ambulance") == UNRESOLVED
+
+
+def test_bare_numbers_are_options():
+    for text, option in [("call 2", 2), ("call two", 2), ("dial the third one", 3)]:
+        result, _ = classifier.match_rules(text)
+        assert (result["intent"], result["contact_option"], result["contact_name"]) == ("call_contact", option, None)
+    result, _ = classifier.match_rules("share with 3")
+    assert (result["intent"], result["contact_option"], result["contact_name"]) == ("share_location", 3, None)
+
+
+def test_phone_numbers_are_left_to_llm():
+    assert classifier.match_rules("dial 100") == UNRESOLVED
+    assert classifier.match_rules("share my location with 112") == UNRESOLVED
+
+
+def test_share_rules():
+    assert classifier.match_rules("share my location with everyone")[0]["contact_option"] == -1
+    assert classifier.match_rules("send my location to Prajwal")[0]["contact_name"] == "Prajwal"
+    assert classifier.match_rules("share with anyone named Kumar")[0]["contact_name"] == "Kumar"
+    assert classifier.match_rules("share my location with someone")[0]["intent"] == "list_share_contacts"
+
+
+def test_yes_no_rules():
+    assert classifier.match_rules("Yeah!")[0] == intent_result("yes_no_response", response="yes")
+    assert classifier.match_rules("no thanks")[0] == intent_result("yes_no_response", response="no")